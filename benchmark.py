@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+import glyphorder
+
+# Client-side performance of built fonts, measured with FreeType (freetype-py).
+#
+# python benchmark.py warmup [-s <size>] [-r <repeat>] <font>...
+#     glyph cache warm-up: load each font and rasterize the frequent
+#     characters of its encoding in frequency order (see `glyphorder.py`)
+#     fonts are named `build/nowar/<encoding>-<font name>.otf`; other names
+#     are measured with the characters of `unspec`
+# python benchmark.py render [-r <repeat>] <pack font directory>...
+#     rasterize representative strings for each `fontlist` slot of a pack,
+#     e.g. `out/Sans-CN-400/Fonts`, at the sizes the client uses for it
+#
+# Results are written as JSON.
+
+warmupCheckpoints = [95, 500, 1000, 2000, 4000]
+
+sampleText = {
+    "enUS": "Quest completed. You receive item: [Thunderfury, Blessed Blade of the Windseeker]. "
+            "Looking for more for Mythic+ 12, need tank & healer!",
+    "ruRU": "Задание выполнено. Вы получаете предмет: [Громовая Ярость, благословенный клинок "
+            "Искателя Ветра]. Ищем танка и лекаря в эпохальный+ 12!",
+    "zhCN": "任务完成。你获得了物品：[雷霆之怒，逐风者的祝福之剑]。史诗钥石12层，缺坦克和治疗！",
+    "zhTW": "任務完成。你獲得了物品：[雷霆之怒，逐風者的祝福之劍]。傳奇鑰石12層，缺坦克和治療！",
+    "koKR": "퀘스트를 완료했습니다. 아이템을 획득했습니다: [우레폭풍, 바람추적자의 축복받은 검]. "
+            "쐐기돌 12단 탱커와 힐러 구합니다!",
+    "combat": "123456 7890 12.3K 4.56M 치명타 暴击 致命一擊",
+}
+
+# sizes in pixels the client draws each kind of text at
+roleSize = {
+    "ui": [10, 12, 14],
+    "chat": [12, 14, 18],
+    "note": [14, 18],
+    "combat": [24, 32],
+}
+
+# {slot: (role, sample texts)}
+slotSample = {
+    "ARIALN": ("chat", ["enUS", "ruRU", "zhCN", "zhTW", "koKR"]),
+    "FRIZQT__": ("ui", ["enUS", "ruRU", "zhCN", "zhTW", "koKR"]),
+    "skurri": ("combat", ["combat"]),
+    "MORPHEUS": ("note", ["enUS"]),
+    "FRIZQT___CYR": ("ui", ["ruRU"]),
+    "SKURRI_CYR": ("combat", ["combat"]),
+    "MORPHEUS_CYR": ("note", ["ruRU"]),
+    "ARKai_C": ("combat", ["combat"]),
+    "ARKai_T": ("ui", ["zhCN"]),
+    "ARHei": ("chat", ["zhCN"]),
+    "arheiuhk_bd": ("chat", ["zhTW"]),
+    "bHEI00M": ("note", ["zhTW"]),
+    "bHEI01B": ("chat", ["zhTW"]),
+    "bKAI00M": ("combat", ["combat"]),
+    "blei00d": ("ui", ["zhTW"]),
+    "2002": ("ui", ["koKR"]),
+    "2002B": ("ui", ["koKR"]),
+    "K_Damage": ("combat", ["combat"]),
+    "K_Pagetext": ("note", ["koKR"]),
+}
+
+
+def FontEncoding(path):
+    encoding = os.path.basename(path).split("-")[0]
+    if encoding in ("abg", "gbk", "big5", "jis", "korean"):
+        return encoding
+    return "unspec"
+
+
+def DropPageCache(path):
+    # read the font from disk again in each round, as the client does after a
+    # restart; not available on every platform
+    if hasattr(os, "posix_fadvise"):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def CurrentRss():
+    # resident set size in bytes, or the peak where the current one is unknown
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def RenderSlot(path, slot, repeat):
+    import freetype
+
+    role, samples = slotSample[slot]
+    text = "".join(sampleText[s] for s in samples)
+    # distinct characters, as the client caches rendered glyphs
+    characters = list(dict.fromkeys(c for c in text if not c.isspace()))
+    sizes = []
+    faceLoad = None
+    faceRss = None
+    for size in roleSize[role]:
+        best = None
+        for _ in range(repeat):
+            rss = CurrentRss()
+            start = time.perf_counter()
+            face = freetype.Face(path)
+            face.set_pixel_sizes(0, size)
+            loaded = time.perf_counter()
+            if faceRss is None:
+                faceRss = CurrentRss() - rss
+            times = []
+            bitmapBytes = 0
+            missing = 0
+            for c in characters:
+                index = face.get_char_index(c)
+                if not index:
+                    missing += 1
+                    continue
+                t = time.perf_counter()
+                face.load_glyph(index, freetype.FT_LOAD_RENDER)
+                times.append(time.perf_counter() - t)
+                bitmap = face.glyph.bitmap
+                bitmapBytes += bitmap.rows * abs(bitmap.pitch)
+            del face
+            faceLoad = loaded - start if faceLoad is None else min(faceLoad, loaded - start)
+            if best is None or sum(times) < sum(best["times"]):
+                best = {"times": times, "bitmapBytes": bitmapBytes, "missing": missing}
+        times = best["times"]
+        sizes.append({
+            "size": size,
+            "glyphs": len(times),
+            "missing": best["missing"],
+            "renderSeconds": sum(times),
+            "perGlyphSeconds": sum(times) / len(times) if times else 0,
+            "maxGlyphSeconds": max(times, default=0),
+            "bitmapBytes": best["bitmapBytes"],
+            "perGlyphBitmapBytes": best["bitmapBytes"] / len(times) if times else 0,
+        })
+    return {
+        "slot": slot,
+        "font": path,
+        "fileBytes": os.path.getsize(path),
+        "role": role,
+        "faceLoadSeconds": faceLoad,
+        "faceRssBytes": faceRss,
+        "sizes": sizes,
+    }
+
+
+def RenderPack(root, repeat):
+    results = []
+    for name in sorted(os.listdir(root)):
+        slot, ext = os.path.splitext(name)
+        if ext.lower() in (".ttf", ".otf") and slot in slotSample:
+            results.append(RenderSlot(os.path.join(root, name), slot, repeat))
+    return {"pack": root, "slots": results}
+
+
+def Warmup(path, size, repeat):
+    import freetype
+
+    characters = glyphorder.FrequentCharacters(FontEncoding(path))
+    rounds = []
+    for _ in range(repeat):
+        DropPageCache(path)
+        start = time.perf_counter()
+        face = freetype.Face(path)
+        face.set_pixel_sizes(0, size)
+        loaded = time.perf_counter()
+        checkpoints = {}
+        indices = []
+        for n, c in enumerate(characters, 1):
+            index = face.get_char_index(c)
+            if index:
+                indices.append(index)
+                face.load_glyph(index, freetype.FT_LOAD_RENDER)
+            if n in warmupCheckpoints or n == len(characters):
+                checkpoints[n] = time.perf_counter() - loaded
+        rounds.append({"faceLoad": loaded - start, "render": checkpoints})
+        del face
+
+    best = min(rounds, key=lambda r: r["faceLoad"] + r["render"][len(characters)])
+    return {
+        "font": path,
+        "encoding": FontEncoding(path),
+        "size": size,
+        "characters": len(characters),
+        "glyphs": len(indices),
+        # the highest glyph id among the first n frequent characters; the
+        # lower, the fewer charstrings the warm-up touches
+        "glyphIdSpan": {
+            n: max(indices[:n], default=0) for n in warmupCheckpoints if n <= len(indices)
+        },
+        "faceLoadSeconds": best["faceLoad"],
+        "renderSeconds": best["render"],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure client-side performance of built fonts with FreeType.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warmupParser = sub.add_parser("warmup", help="glyph cache warm-up in frequency order")
+    warmupParser.add_argument("-s", "--size", type=int, default=14, help="pixel size")
+    warmupParser.add_argument("-r", "--repeat", type=int, default=5,
+                              help="rounds per font, the best is reported")
+    warmupParser.add_argument("-o", "--output", help="JSON file to write, stdout by default")
+    warmupParser.add_argument("font", nargs="+")
+    renderParser = sub.add_parser("render", help="rasterize representative strings for each font slot")
+    renderParser.add_argument("-r", "--repeat", type=int, default=5,
+                              help="rounds per size, the best is reported")
+    renderParser.add_argument("-o", "--output", help="JSON file to write, stdout by default")
+    renderParser.add_argument("pack", nargs="+", help="font directory of a pack")
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("freetype") is None:
+        print("freetype-py is required: pip install freetype-py", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == "warmup":
+        results = [Warmup(path, args.size, args.repeat) for path in args.font]
+    else:
+        results = [RenderPack(root, args.repeat) for root in args.pack]
+    outStr = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8') as outFile:
+            outFile.write(outStr)
+    else:
+        print(outStr)
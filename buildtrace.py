@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import argparse
+
+# Trace of a build run, in the Chrome trace event format
+# (`chrome://tracing` or https://ui.perfetto.dev open it).
+#
+# NOWAR_TRACE=build/trace.json make -j<threads> <targets>
+#     steps run through `cache.py` or `history.py` append a complete event
+#     with their start and end time; the closing bracket of the JSON array is
+#     left out, which the format allows, so parallel steps only append
+# python buildtrace.py analyze build/trace.json [-j <threads>]
+#     critical path, idle core time and the jobs that serialize the build
+
+
+def Record(kind, target, start, end, cached=False):
+    path = os.environ.get("NOWAR_TRACE")
+    if not path:
+        return
+    if not os.path.exists(path):
+        # create the file with its opening bracket in one step
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write("[\n")
+        try:
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        os.remove(tmp)
+    event = {
+        "name": target,
+        "cat": kind,
+        "ph": "X",
+        "ts": int(start * 1e6),
+        "dur": int((end - start) * 1e6),
+        "pid": 1,
+        "tid": os.getpid(),
+        "args": {"cached": cached},
+    }
+    # one short write with O_APPEND does not interleave with other steps
+    with open(path, 'a') as f:
+        f.write(json.dumps(event, separators=(',', ':')) + ",\n")
+
+
+def LoadTrace(path):
+    with open(path) as f:
+        text = f.read().strip()
+    if not text.endswith("]"):
+        text = text.rstrip(",") + "]"
+    events = [e for e in json.loads(text) if e.get("ph") == "X"]
+    return [{
+        "target": e["name"],
+        "kind": e["cat"],
+        "start": e["ts"] / 1e6,
+        "end": (e["ts"] + e["dur"]) / 1e6,
+    } for e in events]
+
+
+def Concurrency(events):
+    # [(start, end, running jobs)] over the span of the build
+    edges = sorted([(e["start"], 1) for e in events] + [(e["end"], -1) for e in events])
+    intervals = []
+    running = 0
+    for (t, delta), (following, _) in zip(edges, edges[1:] + [edges[-1]]):
+        running += delta
+        if following > t:
+            intervals.append((t, following, running))
+    return intervals
+
+
+def CriticalPath(events, graph):
+    # from the job that finished last, follow the input that finished last
+    producer = {}
+    for node in graph.nodes.values():
+        producer[node.target.replace("${VERSION}", str(graph.variable["VERSION"]))] = node
+    byTarget = {e["target"]: e for e in events}
+    event = max(events, key=lambda e: e["end"])
+    path = [event]
+    while True:
+        node = producer.get(event["target"])
+        if node is None:
+            break
+        inputs = [byTarget[p] for p in Inputs(graph, node, producer) if p in byTarget]
+        inputs = [e for e in inputs if e["end"] <= event["start"] + 1e-3]
+        if not inputs:
+            break
+        event = max(inputs, key=lambda e: e["end"])
+        path.append(event)
+    return path[::-1]
+
+
+def Inputs(graph, node, producer):
+    # traced inputs of a node, looking through untraced copies and aliases
+    result = []
+    stack = list(node.inputs)
+    seen = set()
+    while stack:
+        path = stack.pop().replace("${VERSION}", str(graph.variable["VERSION"]))
+        if path in seen:
+            continue
+        seen.add(path)
+        result.append(path)
+        if path in producer and producer[path].kind in ("copy", "phony"):
+            stack.extend(producer[path].inputs)
+    return result
+
+
+def Analyze(path, jobs):
+    events = LoadTrace(path)
+    if not events:
+        print("{}: no events".format(path), file=sys.stderr)
+        return 1
+    start = min(e["start"] for e in events)
+    end = max(e["end"] for e in events)
+    span = end - start
+    busy = sum(e["end"] - e["start"] for e in events)
+    intervals = Concurrency(events)
+
+    print("{} jobs in {:.0f} s, {:.0f} s of job time".format(len(events), span, busy))
+    print("average concurrency {:.1f} of {}, idle core time {:.0f} s ({:.0%})".format(
+        busy / span if span else 0, jobs, max(0, jobs * span - busy),
+        max(0, jobs * span - busy) / (jobs * span) if span else 0))
+
+    print()
+    print("time by running jobs:")
+    levels = {}
+    for a, b, running in intervals:
+        levels[min(running, jobs)] = levels.get(min(running, jobs), 0) + b - a
+    for running in sorted(levels):
+        print("    {:>4}{} {:>8.0f} s".format(running, "+" if running == jobs else " ", levels[running]))
+
+    import configure
+    graph = configure.BuildGraph()
+    path = CriticalPath(events, graph)
+    print()
+    print("critical path: {:.1f} s of job time".format(sum(e["end"] - e["start"] for e in path)))
+    previousEnd = None
+    for e in path:
+        wait = e["start"] - previousEnd if previousEnd is not None else 0
+        print("    {:>8.1f} s  {:<8} {}{}".format(
+            e["end"] - e["start"], e["kind"], e["target"],
+            "  (started {:.0f} s after its input)".format(wait) if wait >= 1 else ""))
+        previousEnd = e["end"]
+
+    # jobs running while few others could: the build waits on them
+    threshold = max(1, jobs // 4)
+    serializing = []
+    for e in events:
+        alone = sum(
+            min(b, e["end"]) - max(a, e["start"])
+            for a, b, running in intervals
+            if running <= threshold and a < e["end"] and b > e["start"])
+        if alone >= 1:
+            serializing.append((alone, e))
+    serializing.sort(key=lambda x: -x[0])
+    consumers = {
+        p.replace("${VERSION}", str(graph.variable["VERSION"])): targets
+        for p, targets in graph.Consumers().items()
+    }
+    print()
+    print("jobs serializing the build (time running with at most {} jobs, direct consumers):".format(threshold))
+    for alone, e in serializing[:10]:
+        print("    {:>8.0f} s  {:>5}  {:<8} {}".format(
+            alone, len(consumers.get(e["target"], [])), e["kind"], e["target"]))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyze a build trace.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    analyzeParser = sub.add_parser("analyze", help="critical path and concurrency of a traced build")
+    analyzeParser.add_argument("trace", help="trace written with NOWAR_TRACE")
+    analyzeParser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                               help="job slots of the traced build")
+    args = parser.parse_args()
+    sys.exit(Analyze(args.trace, args.jobs))
@@ -0,0 +1,296 @@
+import os
+import sys
+import ast
+import zlib
+import shutil
+import hashlib
+import argparse
+import urllib.error
+import urllib.request
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import history
+import buildtrace
+import journal
+
+# Artifact cache for build steps, keyed by the content of their inputs.
+#
+# NOWAR_CACHE_DIR - local cache directory, `cache/` by default; it is outside
+#                   of `build/` so that `make clean` keeps it
+# NOWAR_CACHE_URL - optional HTTP cache shared by several machines, which
+#                   answers `GET <url>/<key>` and `PUT <url>/<key>`;
+#                   `python cache.py serve` is a stand-in server for it
+# NOWAR_CACHE     - set to `0` to disable the cache
+
+# environment variables that change the output of a step
+keyEnvironment = ["SOURCE_DATE_EPOCH", "PYTHONHASHSEED"]
+
+
+class LocalBackend:
+    def __init__(self, root):
+        self.root = root
+
+    def Path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def Get(self, key):
+        try:
+            with open(self.Path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # a hit is a use, for `evict.py`; access times are not updated on
+        # every mount
+        try:
+            os.utime(self.Path(key))
+        except OSError:
+            pass
+        return data
+
+    def Put(self, key, data):
+        path = self.Path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+class HttpBackend:
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def Get(self, key):
+        try:
+            with urllib.request.urlopen("{}/{}".format(self.url, key), timeout=self.timeout) as response:
+                return response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+    def Put(self, key, data):
+        request = urllib.request.Request(
+            "{}/{}".format(self.url, key), data=data, method="PUT",
+            headers={"Content-Type": "application/octet-stream"})
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+def LocalCacheDir():
+    return os.environ.get("NOWAR_CACHE_DIR", "cache")
+
+
+def GetBackends():
+    if os.environ.get("NOWAR_CACHE") == "0":
+        return []
+    backends = [LocalBackend(LocalCacheDir())]
+    if os.environ.get("NOWAR_CACHE_URL"):
+        backends.append(HttpBackend(os.environ["NOWAR_CACHE_URL"]))
+    return backends
+
+
+def HashFile(h, path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+
+def IsMainBlock(node):
+    # `if __name__ == '__main__':`
+    test = node.test if isinstance(node, ast.If) else None
+    return (isinstance(test, ast.Compare) and isinstance(test.left, ast.Name) and
+            test.left.id == "__name__")
+
+
+def LocalImports(path, found=None, script=True):
+    # a script and the modules of this directory it imports, also from
+    # within functions; the main block of an imported module does not run
+    found = [] if found is None else found
+    if path in found:
+        return found
+    found.append(path)
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+    nodes = [tree]
+    while nodes:
+        node = nodes.pop()
+        if not script and IsMainBlock(node):
+            continue
+        nodes.extend(ast.iter_child_nodes(node))
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            module = name.split(".")[0] + ".py"
+            if os.path.isfile(module):
+                LocalImports(module, found, False)
+    return found
+
+
+def ToolFingerprint(h, command):
+    # python steps depend on the script, the local modules it imports and
+    # libotd, others on the executable itself
+    if os.path.basename(command[0]).startswith("python"):
+        sources = LocalImports("configure.py", script=False)
+        if len(command) > 1 and os.path.isfile(command[1]):
+            LocalImports(command[1], sources)
+        sources += sorted(
+            os.path.join(dirpath, name)
+            for dirpath, _, filenames in os.walk("libotd")
+            for name in filenames if name.endswith(".py"))
+    else:
+        executable = shutil.which(command[0])
+        sources = [executable] if executable else []
+    for path in sources:
+        if os.path.isfile(path):
+            h.update(path.encode())
+            HashFile(h, path)
+
+
+def ArtifactKey(outputs, inputs, command):
+    h = hashlib.sha256()
+    h.update("\0".join(command).encode())
+    h.update("\0".join(outputs).encode())
+    for path in inputs:
+        h.update(path.encode())
+        HashFile(h, path)
+    ToolFingerprint(h, command)
+    for name in keyEnvironment:
+        h.update("{}={}".format(name, os.environ.get(name)).encode())
+    return h.hexdigest()
+
+
+def Fetch(backends, key, count):
+    for i, backend in enumerate(backends):
+        try:
+            blobs = [backend.Get("{}-{}".format(key, n)) for n in range(count)]
+        except (OSError, urllib.error.URLError) as e:
+            print("cache: {}".format(e), file=sys.stderr)
+            continue
+        if all(blob is not None for blob in blobs):
+            # copy to the faster backends that missed it
+            Store(backends[:i], key, blobs)
+            return [zlib.decompress(blob) for blob in blobs]
+    return None
+
+
+def Store(backends, key, blobs):
+    for backend in backends:
+        try:
+            for n, blob in enumerate(blobs):
+                backend.Put("{}-{}".format(key, n), blob)
+        except (OSError, urllib.error.URLError) as e:
+            print("cache: {}".format(e), file=sys.stderr)
+
+
+def RunStep(outputs, inputs, command, validate, kind):
+    status, measurement = history.Measure(command)
+    if status == 0 and validate is not None and not validate(outputs):
+        status = 1
+    if status == 0 and kind is not None:
+        history.Record(kind, outputs, inputs, measurement)
+    return status
+
+
+def Run(outputs, inputs, command, validate=None, kind=None):
+    # `validate` checks the outputs of a step that has run; invalid outputs
+    # fail the step and are not stored. Steps with a `kind` that run are
+    # recorded in the build history (`history.py`)
+    start = time.time()
+    backends = GetBackends()
+    if not backends:
+        status = RunStep(outputs, inputs, command, validate, kind)
+        if status == 0:
+            journal.Record(outputs)
+        buildtrace.Record(kind or "step", outputs[0], start, time.time())
+        return status
+
+    key = ArtifactKey(outputs, inputs, command)
+    artifacts = Fetch(backends, key, len(outputs))
+    if artifacts is not None:
+        for path, data in zip(outputs, artifacts):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        journal.Record(outputs)
+        buildtrace.Record(kind or "step", outputs[0], start, time.time(), cached=True)
+        return 0
+
+    status = RunStep(outputs, inputs, command, validate, kind)
+    if status == 0:
+        blobs = []
+        for path in outputs:
+            with open(path, 'rb') as f:
+                blobs.append(zlib.compress(f.read(), 6))
+        Store(backends, key, blobs)
+        journal.Record(outputs)
+    buildtrace.Record(kind or "step", outputs[0], start, time.time())
+    return status
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def Path(self):
+        key = os.path.basename(self.path)
+        return os.path.join(self.server.root, key)
+
+    def do_GET(self):
+        try:
+            with open(self.Path(), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        tmp = "{}.{}.tmp".format(self.Path(), id(self))
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.Path())
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def Serve(root, port):
+    os.makedirs(root, exist_ok=True)
+    server = HTTPServer(("", port), StandInHandler)
+    server.root = root
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Artifact cache for build steps.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    runParser = sub.add_parser("run", help="run a build step, or restore its outputs from the cache")
+    runParser.add_argument("-o", "--output", action="append", required=True,
+                           help="file written by the step")
+    runParser.add_argument("-i", "--input", nargs="*", default=[],
+                           help="files read by the step")
+    runParser.add_argument("-k", "--kind", help="kind of the step, to record it in the build history")
+    runParser.add_argument("step", nargs=argparse.REMAINDER,
+                           help="the step command, after `--`")
+    serveParser = sub.add_parser("serve", help="run a stand-in HTTP cache server")
+    serveParser.add_argument("--root", default="cache-server",
+                             help="directory to store artifacts in")
+    serveParser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        step = args.step[1:] if args.step[:1] == ["--"] else args.step
+        if not step:
+            parser.error("no step command given")
+        sys.exit(Run(args.output, args.input, step, kind=args.kind))
+    else:
+        Serve(args.root, args.port)
@@ -1,8 +1,11 @@
+import sys
 import json
 import codecs
+import argparse
 import enum
 import hashlib
-from functools import reduce
+from dataclasses import dataclass, field, fields, replace
+from functools import lru_cache, reduce, wraps
 from itertools import product
 
 
@@ -38,9 +41,56 @@ class Config:
         ("Bliz", ["OSF"]),
     ]
 
+    # how dumped Source Han Sans fonts are kept in `build/shs/`:
+    #   "dump"  - one full document per region
+    #   "store" - one glyph store per weight, with outlines shared between
+    #             regions stored once, and a reference file per region (see
+    #             `glyphstore.py`); saves disk space, but every merge reads
+    #             the outlines of all regions
+    #   "delta" - `shsDeltaBase` in full, other regions as deltas against it
+    shsStorage = "dump"
+    shsDeltaBase = "SourceHanSansK"
+
+    # prune each encoded font to the characters of its client locale, e.g.
+    # GBK for `gbk` or Latin, Greek and Cyrillic only for `abg` (see
+    # `set-encoding.py`); fonts for every locale (`unspec`) are kept whole
+    subsetByEncoding = False
+
+    # glyph order of the fonts:
+    #   "default"   - as left by merging and garbage collection
+    #   "frequency" - glyphs of frequent characters of each encoding first,
+    #                 for better glyph cache locality (see `glyphorder.py`)
+    glyphOrder = "default"
+
+    # remove duplicate and collinear on-curve points of merged fonts, within
+    # `simplifyTolerance` font units (see `outline.py`)
+    simplifyOutline = False
+    simplifyTolerance = 1
+
+    # the client draws glyphs from `cmap` without shaping. "flatten" removes
+    # GSUB, GPOS and GDEF from merged fonts, after baking the substitutions of
+    # `flattenFeatureTags` into `cmap`; glyphs reachable only through the
+    # removed lookups are dropped with them
+    flattenFeatures = False
+    flattenFeatureTags = []
+
 
 config = Config()
 
+# `Config` fields that only end up in the naming of a font (`merge.NameFont`)
+nameConfigFields = [
+    "version", "fontRevision",
+    "vendor", "vendorId", "vendorUrl",
+    "copyright",
+    "descriptionEn", "descriptionRu", "descriptionLzh", "descriptionJa", "descriptionKo",
+    "designer", "designerUrl",
+    "license", "licenseUrl",
+]
+
+
+def NameConfigStamp():
+    return {k: getattr(config, k) for k in nameConfigFields}
+
 
 # define Chinese characters orthographies, and feature mods:
 #
@@ -227,6 +277,56 @@ featureNameMap = {
 tagNameMap = {**regionNameMap, **featureNameMap}
 
 
+@dataclass(frozen=True, slots=True)
+class Param:
+    # build parameters of a font, hashable so that names and dependencies are
+    # computed once per distinct font. It reads like the dicts it replaces:
+    # fields that are `None` are missing keys. `feature` is kept sorted.
+    family: str
+    weight: int
+    width: int
+    region: str = None
+    feature: tuple = None
+    encoding: str = None
+    slant: str = None
+
+    def __post_init__(self):
+        if self.feature is not None:
+            object.__setattr__(self, "feature", tuple(sorted(self.feature)))
+
+    @staticmethod
+    def From(p):
+        return p if isinstance(p, Param) else Param(**p)
+
+    def keys(self):
+        return [f.name for f in fields(self) if getattr(self, f.name) is not None]
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+
+def MemoizedByParam(function):
+    # results are shared between callers and must not be modified
+    cached = lru_cache(maxsize=1 << 16)(function)
+
+    @wraps(function)
+    def Memoized(p):
+        return cached(Param.From(p))
+    Memoized.cache_info = cached.cache_info
+    return Memoized
+
+
+@MemoizedByParam
 def LocalizedFamily(p):
     if "nameList" not in LocalizedFamily.__dict__:
         LocalizedFamily.nameList = {
@@ -282,6 +382,7 @@ def TagListToStr(lst):
     return ",".join(lst)
 
 
+@MemoizedByParam
 def GenerateFontName(p):
     localizedFamily = LocalizedFamily(p)
     region = p["region"]
@@ -358,6 +459,7 @@ def GenerateFontName(p):
     }
 
 
+@MemoizedByParam
 def GenerateFilename(p):
     if p["family"] in ("Sans", "Cursive"):
         filename = GenerateFontName(p)["file"]
@@ -379,34 +481,35 @@ def GenerateFilename(p):
         return family + "-" + subfamily
 
 
+@MemoizedByParam
 def ResolveDependency(p):
     if p["width"] == 10:  # Warcraft numeral hack
         result = {
-            "Latin": {
-                "family": "lcg" + p["family"],
-                "width": 5,
-                "weight": p["weight"],
-            },
-            "Numeral": {
-                "family": "lcg" + p["family"],
-                "width": 3,
-                "weight": p["weight"],
-            },
+            "Latin": Param(
+                family="lcg" + p["family"],
+                width=5,
+                weight=p["weight"],
+            ),
+            "Numeral": Param(
+                family="lcg" + p["family"],
+                width=3,
+                weight=p["weight"],
+            ),
         }
     else:
         result = {
-            "Latin": {
-                "family": "lcg" + p["family"],
-                "width": p["width"],
-                "weight": p["weight"],
-            },
+            "Latin": Param(
+                family="lcg" + p["family"],
+                width=p["width"],
+                weight=p["weight"],
+            ),
         }
-    result["CJK"] = {
-        "family": "SHS",
-        "weight": p["weight"],
-        "width": 5,
-        "region": shsRegionMap[p["region"]],
-    }
+    result["CJK"] = Param(
+        family="SHS",
+        weight=p["weight"],
+        width=5,
+        region=shsRegionMap[p["region"]],
+    )
     return result
 
 
@@ -588,194 +691,396 @@ def GetKoreanDisplayFont(family, weight, region, feature):
     }
 
 
+def GetFontList(f, w, r, fea):
+    fontlist = {
+        "ARIALN": GetCommonChatFont(f, w, r, fea),
+        "FRIZQT__": GetCommonFont(f, w, r, fea),
+    }
+
+    if regionalVariant[r]["enUS"]:
+        fontlist.update({
+            "skurri": GetLatinFont(f, w, r, fea),
+            "MORPHEUS": GetLatinChatFont(f, w, r, fea),
+        })
+
+    if regionalVariant[r]["ruRU"]:
+        fontlist.update({
+            "FRIZQT___CYR": GetLatinFont(f, w, r, fea),
+            "SKURRI_CYR": GetLatinFont(f, w, r, fea),
+            "MORPHEUS_CYR": GetLatinChatFont(f, w, r, fea),
+        })
+
+    if regionalVariant[r]["zhCN"]:
+        fontlist.update({
+            "ARKai_C": GetHansCombatFont(f, w, r, fea),
+            "ARKai_T": GetHansFont(f, w, r, fea),
+            "ARHei": GetHansChatFont(f, w, r, fea),
+        })
+
+    if regionalVariant[r]["zhTW"]:
+        fontlist.update({
+            "arheiuhk_bd": GetHantChatFont(f, w, r, fea),
+            "bHEI00M": GetHantNoteFont(f, w, r, fea),
+            "bHEI01B": GetHantChatFont(f, w, r, fea),
+            "bKAI00M": GetHantCombatFont(f, w, r, fea),
+            "blei00d": GetHantFont(f, w, r, fea),
+        })
+
+    if regionalVariant[r]["koKR"]:
+        fontlist.update({
+            "2002": GetKoreanFont(f, w, r, fea),
+            "2002B": GetKoreanFont(f, w, r, fea),
+            "K_Damage": GetKoreanCombatFont(f, w, r, fea),
+            "K_Pagetext": GetKoreanDisplayFont(f, w, r, fea),
+        })
+
+    return fontlist
+
+
+def powerset(lst): return reduce(lambda result, x: result +
+                                 [subset + [x] for subset in result], lst, [[]])
+
+
+def GetFontPacks():
+    return product(config.fontPackFamily, config.fontPackRegion, config.fontPackWeight, powerset(config.fontPackFeature))
+
+
+def GetPackName(family, region, weight, feature):
+    return "{}-{}-{}".format(config.fontPackFamily[family], TagListToStr([region] + feature), weight)
+
+
+def IsExportedPack(region, feature):
+    return feature == [] or (region, feature) in config.fontPackExportFeature
+
+
+def GetMergeParams():
+    for f, w, wd, r, fea in product(config.fontPackFamily, config.fontPackWeight, [3, 5, 7, 10], regionNameMap.keys(), powerset(featureNameMap.keys())):
+        yield Param(
+            family=f,
+            weight=w,
+            width=wd,
+            region=r,
+            feature=fea,
+            encoding="unspec",
+        )
+
+
+def GetSourceDumps():
+    # {dump: (source, glyph name prefix)} of every source font
+    dumps = {}
+    for param in GetMergeParams():
+        dep = ResolveDependency(param)
+        for kind in ("Latin", "Numeral"):
+            if kind in dep:
+                filename = GenerateFilename(dep[kind])
+                dumps["build/lcg/{}.otd".format(filename)] = ("source/lcg/{}.otf".format(filename), "latn")
+        filename = GenerateFilename(dep["CJK"])
+        dumps["build/shs/{}.otd".format(filename)] = ("source/shs/{}.otf".format(filename), "hani")
+    return dumps
+
+
 def ParamToArgument(param):
-    js = json.dumps(param, separators=(',', ':'))
+    js = json.dumps(dict(param), separators=(',', ':'))
     return "'{}'".format(js)
 
 
-if __name__ == "__main__":
-    makefile = {
-        "variable": {
-            "VERSION": config.version,
-        },
-        "rule": {
-            ".PHONY": {
-                "depend": ["all"],
-            },
-            "all": {
-                "depend": [],
-            },
-            "clean": {
-                "command": [
-                    "-rm -rf build/",
-                    "-rm -rf out/??*-???/",
-                ]
-            }
-        },
-    }
+def CachedCommand(kind, command, extraOutputs=[]):
+    # run a build step through the artifact cache (`cache.py`)
+    outputs = " ".join("-o " + o for o in ["$@", *extraOutputs])
+    return "python cache.py run -k {} {} -i $^ -- {}".format(kind, outputs, command)
+
 
-    def powerset(lst): return reduce(lambda result, x: result +
-                                     [subset + [x] for subset in result], lst, [[]])
+def RecordedCommand(kind, command):
+    # run a build step recording its cost in the build history (`history.py`)
+    return "python history.py run -k {} -o $@ -i $^ -- {}".format(kind, command)
+
+
+# rough cost of one job of each kind, for planners: (CPU seconds, peak RSS in
+# MiB) on a typical build machine
+costHint = {
+    "dump": (30, 1500),
+    "store": (120, 6000),
+    "delta": (60, 3000),
+    "merge": (90, 3500),
+    "encode": (20, 1800),
+    "compile": (45, 1200),
+    "copy": (0.1, 10),
+    "pack": (60, 800),
+    "release": (300, 1000),
+}
+
+# nodes without files of their own
+phonyKinds = ("phony", "task")
+# nodes of files under `build/`
+evictableKinds = ("dump", "store", "delta", "merge", "encode", "compile")
+
+
+@dataclass
+class Node:
+    # a rule of the build graph:
+    #   "dump"    - dump a source font (`ingest.py`)
+    #   "store", "delta"
+    #             - compact Source Han Sans dumps (`glyphstore.py`)
+    #   "merge"   - merge Latin and CJK fonts (`merge.py`)
+    #   "encode"  - derive a font for one encoding (`set-encoding.py`)
+    #   "compile" - build an OpenType font (`otfccbuild`)
+    #   "copy"    - put a font into a pack directory
+    #   "pack", "release"
+    #             - archive packs (`pack.py`, `release.py`)
+    #   "phony"   - alias of other targets
+    #   "task"    - command not producing a file
+    kind: str
+    target: str
+    inputs: list = field(default_factory=list)
+    command: list = field(default_factory=list)
+    param: Param = None
+    # files written besides `target`
+    extraOutputs: list = field(default_factory=list)
+
+    @property
+    def outputs(self):
+        return [] if self.kind in phonyKinds else [self.target, *self.extraOutputs]
+
+    @property
+    def cost(self):
+        return costHint.get(self.kind, (0, 0))
+
+
+class Graph:
+    def __init__(self):
+        self.variable = {}
+        self.export = {}
+        self.nodes = {}
+        self.phony = []
+        # files make removes once their consumers are built
+        self.intermediate = []
+        # files make keeps, but does not rebuild when missing as long as their
+        # consumers are up to date; `evict.py` removes them under a disk budget
+        self.secondary = []
+
+    def Add(self, node):
+        # a target added again replaces the node in place
+        self.nodes[node.target] = node
+        if node.kind in phonyKinds and node.target not in self.phony:
+            self.phony.append(node.target)
+        return node
+
+    def Intermediate(self, path):
+        if path not in self.intermediate:
+            self.intermediate.append(path)
+
+    def Secondary(self, path):
+        if path not in self.secondary:
+            self.secondary.append(path)
+
+    def Producer(self, path):
+        return self.nodes.get(path)
+
+    def Consumers(self):
+        # {input: [target]}
+        consumers = {}
+        for target, node in self.nodes.items():
+            for path in node.inputs:
+                consumers.setdefault(path, []).append(target)
+        return consumers
+
+    def Closure(self, targets):
+        # nodes needed to build `targets`, each after the nodes it depends on
+        order = []
+        visited = set()
+        for target in targets:
+            if target in visited:
+                continue
+            visited.add(target)
+            stack = [(target, iter(self.nodes[target].inputs))]
+            while stack:
+                current, inputs = stack[-1]
+                for path in inputs:
+                    if path in self.nodes and path not in visited:
+                        visited.add(path)
+                        stack.append((path, iter(self.nodes[path].inputs)))
+                        break
+                else:
+                    stack.pop()
+                    order.append(self.nodes[current])
+        return order
+
+    def Makefile(self):
+        # lines are joined once; appending to one string is quadratic here
+        makedump = []
+
+        for var, val in self.variable.items():
+            makedump.append("{}={}\n".format(var, val))
+
+        for var, val in self.export.items():
+            makedump.append("export {}={}\n".format(var, val))
+
+        rules = [(".PHONY", self.phony, [])]
+        if self.intermediate:
+            rules.append((".INTERMEDIATE", self.intermediate, []))
+        if self.secondary:
+            rules.append((".SECONDARY", self.secondary, []))
+        rules += [(target, node.inputs, node.command) for target, node in self.nodes.items()]
+        for tar, dep, com in rules:
+            makedump.append("{}: {}\n".format(tar, " ".join(dep)))
+            for c in com:
+                makedump.append("\t{}\n".format(c))
+
+        return "".join(makedump)
+
+
+def BuildGraph():
+    graph = Graph()
+    graph.variable.update({
+        "VERSION": config.version,
+        "PACKFLAGS": "",
+        "INGESTJOBS": "4",
+        "DISKBUDGET": "20G",
+    })
+    # output tables are sorted before writing (`glyphorder.SortTables`); the
+    # fixed hash seed also keeps the set iterations inside libotd stable
+    graph.export["PYTHONHASHSEED"] = "0"
+
+    graph.Add(Node("phony", "all"))
+    graph.Add(Node("task", "ingest", command=["python ingest.py --all -j ${INGESTJOBS}"]))
+    graph.Add(Node("task", "refresh-name", command=["python refresh-name.py"]))
+    graph.Add(Node("task", "verify", command=["python journal.py"]))
+    graph.Add(Node("task", "evict", command=["python evict.py ${DISKBUDGET}"]))
+    graph.Add(Node("task", "clean", command=[
+        "-rm -rf build/",
+        "-rm -rf out/??*-???/",
+    ]))
 
     # font pack for each regional variant and weight
-    for f, r, w, fea in product(config.fontPackFamily, config.fontPackRegion, config.fontPackWeight, powerset(config.fontPackFeature)):
+    for f, r, w, fea in GetFontPacks():
         tagList = [r] + fea
         target = "{}-{}".format(TagListToStr(tagList), w)
-        pack = "out/{}-{}-${{VERSION}}.7z".format(
-            config.fontPackFamily[f], target)
+        pack = "out/{}-${{VERSION}}.7z".format(GetPackName(f, r, w, fea))
         target = "{}-{}".format(f, target)
 
-        makefile["rule"][".PHONY"]["depend"].append(target)
-        makefile["rule"][target] = {
-            "depend": [pack],
-        }
+        graph.Add(Node("phony", target, [pack]))
 
-        if fea == [] or (r, fea) in config.fontPackExportFeature:
-            makefile["rule"]["all"]["depend"].append(pack)
+        if IsExportedPack(r, fea):
+            graph.nodes["all"].inputs.append(pack)
 
-        fontlist = {
-            "ARIALN": GetCommonChatFont(f, w, r, fea),
-            "FRIZQT__": GetCommonFont(f, w, r, fea),
-        }
+        fontlist = GetFontList(f, w, r, fea)
 
-        if regionalVariant[r]["enUS"]:
-            fontlist.update({
-                "skurri": GetLatinFont(f, w, r, fea),
-                "MORPHEUS": GetLatinChatFont(f, w, r, fea),
-            })
-
-        if regionalVariant[r]["ruRU"]:
-            fontlist.update({
-                "FRIZQT___CYR": GetLatinFont(f, w, r, fea),
-                "SKURRI_CYR": GetLatinFont(f, w, r, fea),
-                "MORPHEUS_CYR": GetLatinChatFont(f, w, r, fea),
-            })
-
-        if regionalVariant[r]["zhCN"]:
-            fontlist.update({
-                "ARKai_C": GetHansCombatFont(f, w, r, fea),
-                "ARKai_T": GetHansFont(f, w, r, fea),
-                "ARHei": GetHansChatFont(f, w, r, fea),
-            })
-
-        if regionalVariant[r]["zhTW"]:
-            fontlist.update({
-                "arheiuhk_bd": GetHantChatFont(f, w, r, fea),
-                "bHEI00M": GetHantNoteFont(f, w, r, fea),
-                "bHEI01B": GetHantChatFont(f, w, r, fea),
-                "bKAI00M": GetHantCombatFont(f, w, r, fea),
-                "blei00d": GetHantFont(f, w, r, fea),
-            })
-
-        if regionalVariant[r]["koKR"]:
-            fontlist.update({
-                "2002": GetKoreanFont(f, w, r, fea),
-                "2002B": GetKoreanFont(f, w, r, fea),
-                "K_Damage": GetKoreanCombatFont(f, w, r, fea),
-                "K_Pagetext": GetKoreanDisplayFont(f, w, r, fea),
-            })
-
-        makefile["rule"][pack] = {
-            "depend": ["out/{}/Fonts/{}.ttf".format(target, f) for f in fontlist],
-            "command": [
-                "cd out/{};".format(target) +
-                "cp ../../LICENSE.txt Fonts/LICENSE.txt;" +
-                "7z a -t7z -m0=LZMA:d=512m:fb=273 -ms ../../$@ Fonts/"
-            ]
-        }
+        graph.Add(Node("pack", pack, ["out/{}/Fonts/{}.ttf".format(target, f) for f in fontlist], [
+            "cp LICENSE.txt out/{}/Fonts/LICENSE.txt".format(target),
+            RecordedCommand("pack", "python pack.py ${{PACKFLAGS}} $@ out/{}/Fonts".format(target)),
+        ], extraOutputs=["out/{}/Fonts/LICENSE.txt".format(target)]))
 
         for f, p in fontlist.items():
-            makefile["rule"]["out/{}/Fonts/{}.ttf".format(target, f)] = {
-                "depend": ["build/nowar/{}.otf".format(GenerateFilename(p))],
-                "command": [
-                    "mkdir -p out/{}/Fonts".format(target),
-                    "cp $^ $@",
-                ]
-            }
+            graph.Add(Node("copy", "out/{}/Fonts/{}.ttf".format(target, f), [
+                "build/nowar/{}.otf".format(GenerateFilename(p)),
+            ], [
+                "mkdir -p out/{}/Fonts".format(target),
+                "cp $^ $@",
+            ], Param.From(p)))
+
+    # deduplicated release archive of the exported packs
+    release = "out/{}-Release-${{VERSION}}.7z".format(config.fontPackFamily["Sans"])
+    graph.Add(Node("phony", "release", [release]))
+    graph.Add(Node("release", release, [*{
+        "build/nowar/{}.otf".format(GenerateFilename(p)): None
+        for f, r, w, fea in GetFontPacks() if IsExportedPack(r, fea)
+        for p in GetFontList(f, w, r, fea).values()
+    }, "install.py"], [RecordedCommand("release", "python release.py ${PACKFLAGS} $@")]))
 
     # otf files
-    for f, w, wd, r, fea in product(config.fontPackFamily, config.fontPackWeight, [3, 5, 7, 10], regionNameMap.keys(), powerset(featureNameMap.keys())):
-        param = {
-            "family": f,
-            "weight": w,
-            "width": wd,
-            "region": r,
-            "feature": fea,
-            "encoding": "unspec",
-        }
-        makefile["rule"]["build/nowar/{}.otf".format(GenerateFilename(param))] = {
-            "depend": ["build/nowar/{}.otd".format(GenerateFilename(param))],
-            "command": ["otfccbuild -q -O3 --keep-average-char-width $< -o $@"]
-        }
+    for param in GetMergeParams():
+        graph.Add(Node("compile", "build/nowar/{}.otf".format(GenerateFilename(param)), [
+            "build/nowar/{}.otd".format(GenerateFilename(param)),
+        ], [CachedCommand("compile", "otfccbuild -q -O3 --keep-average-char-width --keep-modified-time $< -o $@")], param))
         dep = ResolveDependency(param)
-        makefile["rule"]["build/nowar/{}.otd".format(GenerateFilename(param))] = {
-            "depend": [
-                "build/lcg/{}.otd".format(GenerateFilename(dep["Latin"])),
-                "build/shs/{}.otd".format(
-                    GenerateFilename(dep["CJK"])),
-            ] + ([
-                "build/lcg/{}.otd".format(
-                    GenerateFilename(dep["Numeral"]))
-            ] if "Numeral" in dep else []),
-            "command": [
-                "mkdir -p build/nowar/",
-                "python merge.py {}".format(ParamToArgument(param))
-            ]
-        }
-        makefile["rule"]["build/lcg/{}.otd".format(GenerateFilename(dep["Latin"]))] = {
-            "depend": ["source/lcg/{}.otf".format(GenerateFilename(dep["Latin"]))],
-            "command": [
-                "mkdir -p build/lcg/",
-                "otfccdump --glyph-name-prefix latn --ignore-hints $< -o $@",
+        if config.shsStorage == "store":
+            store = "build/shs/{}.json".format(GenerateFilename(
+                replace(dep["CJK"], region="Store")))
+            regionDump = "build/shs/{}.otd".format(GenerateFilename(dep["CJK"]))
+            ref = "build/shs/{}.ref.json".format(GenerateFilename(dep["CJK"]))
+            asianDepend = [ref, store]
+            storeDepend = [
+                "build/shs/{}.otd".format(GenerateFilename(replace(dep["CJK"], region=shs)))
+                for shs in dict.fromkeys(shsRegionMap.values())
             ]
-        }
-        if "Numeral" in dep:
-            makefile["rule"]["build/lcg/{}.otd".format(GenerateFilename(dep["Numeral"]))] = {
-                "depend": ["source/lcg/{}.otf".format(GenerateFilename(dep["Numeral"]))],
-                "command": [
+            graph.Add(Node("store", store, storeDepend, [
+                CachedCommand("store", "python glyphstore.py store $@ $^"),
+            ], replace(dep["CJK"], region="Store")))
+            graph.Add(Node("store", ref, [regionDump], [
+                CachedCommand("store", "python glyphstore.py ref $@ $^"),
+            ], dep["CJK"]))
+            # region dumps are removed once the store and references are built
+            for d in storeDepend:
+                graph.Intermediate(d)
+        elif config.shsStorage == "delta" and dep["CJK"]["region"] != config.shsDeltaBase:
+            baseDump = "build/shs/{}.otd".format(GenerateFilename(
+                replace(dep["CJK"], region=config.shsDeltaBase)))
+            regionDump = "build/shs/{}.otd".format(GenerateFilename(dep["CJK"]))
+            delta = "build/shs/{}.delta.json".format(GenerateFilename(dep["CJK"]))
+            asianDepend = [baseDump, delta]
+            graph.Add(Node("delta", delta, [baseDump, regionDump], [
+                CachedCommand("delta", "python glyphstore.py delta $@ $^"),
+            ], dep["CJK"]))
+            # region dumps are removed once the delta is built
+            graph.Intermediate(regionDump)
+        else:
+            asianDepend = ["build/shs/{}.otd".format(GenerateFilename(dep["CJK"]))]
+        graph.Add(Node("merge", "build/nowar/{}.otd".format(GenerateFilename(param)), [
+            "build/lcg/{}.otd".format(GenerateFilename(dep["Latin"])),
+            *asianDepend,
+        ] + ([
+            "build/lcg/{}.otd".format(
+                GenerateFilename(dep["Numeral"]))
+        ] if "Numeral" in dep else []), [
+            "mkdir -p build/nowar/",
+            CachedCommand("merge", "python merge.py {}".format(ParamToArgument(param)),
+                          ["build/name/{}.json".format(GenerateFilename(param))]),
+        ], param, ["build/name/{}.json".format(GenerateFilename(param))]))
+        for kind in ("Latin", "Numeral"):
+            if kind in dep:
+                graph.Add(Node("dump", "build/lcg/{}.otd".format(GenerateFilename(dep[kind])), [
+                    "source/lcg/{}.otf".format(GenerateFilename(dep[kind])),
+                ], [
                     "mkdir -p build/lcg/",
-                    "otfccdump --glyph-name-prefix latn --ignore-hints $< -o $@",
-                ]
-            }
-        makefile["rule"]["build/shs/{}.otd".format(GenerateFilename(dep["CJK"]))] = {
-            "depend": ["source/shs/{}.otf".format(GenerateFilename(dep["CJK"]))],
-            "command": [
-                "mkdir -p build/shs/",
-                "otfccdump --glyph-name-prefix hani --ignore-hints $< -o $@",
-            ]
-        }
+                    "python ingest.py $< $@ latn",
+                ], dep[kind]))
+        graph.Add(Node("dump", "build/shs/{}.otd".format(GenerateFilename(dep["CJK"])), [
+            "source/shs/{}.otf".format(GenerateFilename(dep["CJK"])),
+        ], [
+            "mkdir -p build/shs/",
+            "python ingest.py $< $@ hani",
+        ], dep["CJK"]))
 
         # set encoding
         for e in ["abg", "gbk", "big5", "jis", "korean"]:
-            enc = {
-                "family": f,
-                "weight": w,
-                "width": wd,
-                "region": r,
-                "feature": fea,
-                "encoding": e,
-            }
-            makefile["rule"]["build/nowar/{}.otf".format(GenerateFilename(enc))] = {
-                "depend": ["build/nowar/{}.otd".format(GenerateFilename(enc))],
-                "command": ["otfccbuild -q -O3 --keep-average-char-width $< -o $@"]
-            }
-            makefile["rule"]["build/nowar/{}.otd".format(GenerateFilename(enc))] = {
-                "depend": ["build/nowar/{}.otd".format(GenerateFilename(param))],
-                "command": ["python set-encoding.py {}".format(ParamToArgument(enc))]
-            }
+            enc = replace(param, encoding=e)
+            graph.Add(Node("compile", "build/nowar/{}.otf".format(GenerateFilename(enc)), [
+                "build/nowar/{}.otd".format(GenerateFilename(enc)),
+            ], [CachedCommand("compile", "otfccbuild -q -O3 --keep-average-char-width --keep-modified-time $< -o $@")], enc))
+            graph.Add(Node("encode", "build/nowar/{}.otd".format(GenerateFilename(enc)), [
+                "build/nowar/{}.otd".format(GenerateFilename(param)),
+            ], [CachedCommand("encode", "python set-encoding.py {}".format(ParamToArgument(enc)))], enc))
 
-    # dump `makefile` dict to actual “GNU Makefile”
-    makedump = ""
+    # files under `build/` can be evicted without rebuilding the packs made
+    # from them
+    for target, node in graph.nodes.items():
+        if node.kind in evictableKinds and target not in graph.intermediate:
+            graph.Secondary(target)
 
-    for var, val in makefile["variable"].items():
-        makedump += "{}={}\n".format(var, val)
+    return graph
 
-    for tar, recipe in makefile["rule"].items():
-        dep = recipe["depend"] if "depend" in recipe else []
-        makedump += "{}: {}\n".format(tar, " ".join(dep))
-        com = recipe["command"] if "command" in recipe else []
-        for c in com:
-            makedump += "\t{}\n".format(c)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the Makefile, or plan a build.")
+    parser.add_argument("--plan", nargs="+", metavar="TARGET",
+                        help="report the jobs needed to build the targets instead")
+    parser.add_argument("--memory", type=float, metavar="GIB",
+                        help="memory of the build machine, to suggest `-j` with --plan")
+    args = parser.parse_args()
+
+    graph = BuildGraph()
+    if args.plan:
+        import plan
+        sys.exit(plan.Report(graph, args.plan, args.memory))
     with codecs.open("Makefile", 'w', 'UTF-8') as mf:
-        mf.write(makedump)
+        mf.write(graph.Makefile())
@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import lzma
+import hashlib
+import argparse
+
+# delta instructions
+opAdd = 0
+opCopy = 1
+
+blockSize = 16
+magic = b"NWDP\x01"
+
+
+def WriteNumber(n):
+    result = bytearray()
+    while n >= 0x80:
+        result.append(n & 0x7F | 0x80)
+        n >>= 7
+    result.append(n)
+    return result
+
+
+def ReadNumber(data, pos):
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        shift += 7
+        if b < 0x80:
+            return n, pos
+
+
+def MatchLength(old, oldPos, new, newPos):
+    length = 0
+    chunk = 4096
+    limit = min(len(old) - oldPos, len(new) - newPos)
+    while length + chunk <= limit and old[oldPos + length:oldPos + length + chunk] == new[newPos + length:newPos + length + chunk]:
+        length += chunk
+    while length < limit and old[oldPos + length] == new[newPos + length]:
+        length += 1
+    return length
+
+
+def Diff(old, new):
+    # index the old file by aligned blocks, then scan the new file for blocks
+    # found in it and extend each hit in both directions
+    index = {}
+    for i in range(0, len(old) - blockSize + 1, blockSize):
+        index.setdefault(old[i:i + blockSize], i)
+
+    delta = bytearray()
+
+    def Add(data):
+        if data:
+            delta.append(opAdd)
+            delta.extend(WriteNumber(len(data)))
+            delta.extend(data)
+
+    def Copy(offset, length):
+        delta.append(opCopy)
+        delta.extend(WriteNumber(offset))
+        delta.extend(WriteNumber(length))
+
+    pos = pending = 0
+    while pos + blockSize <= len(new):
+        hit = index.get(new[pos:pos + blockSize])
+        if hit is None:
+            pos += 1
+            continue
+        start, newStart = hit, pos
+        while start > 0 and newStart > pending and old[start - 1] == new[newStart - 1]:
+            start -= 1
+            newStart -= 1
+        length = MatchLength(old, start, new, newStart)
+        Add(new[pending:newStart])
+        Copy(start, length)
+        pos = pending = newStart + length
+    Add(new[pending:])
+    return bytes(delta)
+
+
+def Patch(old, delta):
+    new = bytearray()
+    pos = 0
+    while pos < len(delta):
+        op = delta[pos]
+        if op == opAdd:
+            length, pos = ReadNumber(delta, pos + 1)
+            new.extend(delta[pos:pos + length])
+            pos += length
+        elif op == opCopy:
+            offset, pos = ReadNumber(delta, pos + 1)
+            length, pos = ReadNumber(delta, pos)
+            new.extend(old[offset:offset + length])
+        else:
+            raise ValueError("invalid delta instruction {}".format(op))
+    return bytes(new)
+
+
+def Sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def ListFiles(root):
+    return sorted(name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name)))
+
+
+def DiffDirectory(oldRoot, newRoot):
+    entries = []
+    payload = bytearray()
+    oldFiles = set(ListFiles(oldRoot))
+    for name in ListFiles(newRoot):
+        with open(os.path.join(newRoot, name), 'rb') as f:
+            new = f.read()
+        entry = {"name": name, "new": Sha256(new)}
+        if name in oldFiles:
+            with open(os.path.join(oldRoot, name), 'rb') as f:
+                old = f.read()
+            entry["old"] = Sha256(old)
+            if entry["old"] == entry["new"]:
+                continue
+            data = Diff(old, new)
+        else:
+            data = new
+        entry["size"] = len(data)
+        entries.append(entry)
+        payload += data
+    for name in sorted(oldFiles - set(ListFiles(newRoot))):
+        entries.append({"name": name, "delete": True})
+
+    header = json.dumps(entries, separators=(',', ':')).encode()
+    body = magic + bytes(WriteNumber(len(header))) + header + payload
+    return lzma.compress(body, preset=9 | lzma.PRESET_EXTREME)
+
+
+def ApplyDirectory(root, patch):
+    body = lzma.decompress(patch)
+    if not body.startswith(magic):
+        raise ValueError("not a delta patch")
+    length, pos = ReadNumber(body, len(magic))
+    entries = json.loads(body[pos:pos + length])
+    pos += length
+
+    # check everything before touching any file
+    results = []
+    for entry in entries:
+        path = os.path.join(root, entry["name"])
+        if entry.get("delete"):
+            results.append((path, None))
+            continue
+        data = body[pos:pos + entry["size"]]
+        pos += entry["size"]
+        if "old" in entry:
+            with open(path, 'rb') as f:
+                old = f.read()
+            if Sha256(old) != entry["old"]:
+                raise ValueError("{} does not match the patch base".format(path))
+            data = Patch(old, data)
+        if Sha256(data) != entry["new"]:
+            raise ValueError("{} is corrupted after patching".format(path))
+        results.append((path, data))
+
+    for path, data in results:
+        if data is None:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        tmp = path + ".tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Create or apply binary delta patches between two releases of a font pack.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    diffParser = sub.add_parser("diff", help="diff the fonts of two pack directories")
+    diffParser.add_argument("old", help="font directory of the previous release")
+    diffParser.add_argument("new", help="font directory of the new release")
+    diffParser.add_argument("patch", help="patch file to write")
+    applyParser = sub.add_parser("apply", help="update a font directory in place")
+    applyParser.add_argument("root", help="font directory to update, e.g. `World of Warcraft/_retail_/Fonts`")
+    applyParser.add_argument("patch", help="patch file to apply")
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        patch = DiffDirectory(args.old, args.new)
+        with open(args.patch, 'wb') as f:
+            f.write(patch)
+        print("{}: {} bytes".format(args.patch, len(patch)))
+    else:
+        with open(args.patch, 'rb') as f:
+            patch = f.read()
+        try:
+            ApplyDirectory(args.root, patch)
+        except (ValueError, OSError, lzma.LZMAError) as e:
+            print("error: {}".format(e), file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,124 @@
+import os
+import sys
+import argparse
+import configure
+import history
+import cache
+
+# Keep the intermediate files of the build graph and the local artifact cache
+# (`cache.py`) under a disk budget.
+#
+# Dumps, merged and encoded documents and compiled fonts in `build/` are
+# declared `.SECONDARY` in the Makefile, so make does not rebuild a missing
+# one as long as the files made from it are up to date; it is remade only
+# when it is needed again. Artifacts in the local cache are only copies, and
+# go first. Files are evicted in this order:
+#   1. files all of whose consumers are built and newer, and cached
+#      artifacts, before others
+#   2. files that are cheap to make again for their size
+#   3. files used least recently
+#
+# python evict.py [-n] <budget>
+#     e.g. `python evict.py 20G`; `make evict DISKBUDGET=20G` does the same
+
+def ParseSize(text):
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def FormatSize(size):
+    return "{:.1f} GiB".format(size / (1 << 30))
+
+
+def Candidates(graph):
+    version = str(graph.variable["VERSION"])
+    consumers = graph.Consumers()
+    models = history.Models()
+    for target in graph.secondary:
+        node = graph.nodes[target]
+        try:
+            stat = os.stat(target)
+        except FileNotFoundError:
+            continue
+        consumedBy = [graph.nodes[t] for t in consumers.get(target, [])
+                      if graph.nodes[t].kind not in configure.phonyKinds]
+        consumed = bool(consumedBy)
+        for consumer in consumedBy:
+            try:
+                if os.stat(consumer.target.replace("${VERSION}", version)).st_mtime_ns < stat.st_mtime_ns:
+                    consumed = False
+            except FileNotFoundError:
+                consumed = False
+        if node.kind in models:
+            inputBytes = sum(os.path.getsize(p) for p in node.inputs if os.path.isfile(p))
+            cost = models[node.kind][0].Predict(inputBytes or None)
+        else:
+            cost = node.cost[0]
+        yield {
+            "path": target,
+            "kind": node.kind,
+            "size": stat.st_size,
+            # access times are not updated on every mount; a rebuild is a use
+            "lastUse": max(stat.st_atime, stat.st_mtime),
+            "consumed": consumed,
+            "cost": cost,
+        }
+
+
+def CacheCandidates(root):
+    # a step whose artifacts were evicted runs again on a cache miss
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield {
+                "path": path,
+                "kind": "cache",
+                "size": stat.st_size,
+                "lastUse": max(stat.st_atime, stat.st_mtime),
+                "consumed": True,
+                "cost": 0,
+            }
+
+
+def Evict(graph, budget, dryRun=False):
+    candidates = list(Candidates(graph)) + list(CacheCandidates(cache.LocalCacheDir()))
+    total = sum(c["size"] for c in candidates)
+    print("{} intermediate files and cached artifacts, {} of {} budget".format(len(candidates), FormatSize(total), FormatSize(budget)))
+    if total <= budget:
+        return 0
+
+    candidates.sort(key=lambda c: (not c["consumed"], c["cost"] / max(c["size"], 1), c["lastUse"]))
+    evicted = 0
+    freed = 0
+    for c in candidates:
+        if total <= budget:
+            break
+        if not dryRun:
+            os.remove(c["path"])
+        print("{} {} ({}, {:.0f} s to rebuild{})".format(
+            "would evict" if dryRun else "evicted", c["path"], c["kind"], c["cost"],
+            ", consumed" if c["consumed"] else ""))
+        total -= c["size"]
+        freed += c["size"]
+        evicted += 1
+    print("{} files, {} {}".format(evicted, FormatSize(freed), "to free" if dryRun else "freed"))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evict intermediate build files above a disk budget.")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="only list the files to evict")
+    parser.add_argument("budget", help="size to keep intermediate files under, e.g. `20G`")
+    args = parser.parse_args()
+    try:
+        budget = ParseSize(args.budget)
+    except ValueError:
+        parser.error("invalid budget {}".format(args.budget))
+    sys.exit(Evict(configure.BuildGraph(), budget, args.dry_run))
@@ -0,0 +1,103 @@
+import configure
+
+# Frequency-ordered glyph order (`Config.glyphOrder = "frequency"`).
+#
+# Glyphs of the most frequent characters of an encoding are moved to the
+# front of `glyph_order`, so that the charstrings or outlines the client reads
+# for common UI and chat text are contiguous in the font and the glyph cache
+# warms up from a few pages. Other glyphs keep their relative order.
+#
+# Frequency tiers are the common character levels of the national standards,
+# each in the order of its code table:
+#   GB 2312 level 1 (3755 hanzi), Big5 frequently used hanzi (5401),
+#   JIS X 0208 level 1 (2965 kanji), KS X 1001 hangul (2350 syllables)
+#
+# Whatever the glyph order, `cmap` is written sorted by code point and `glyf`
+# in glyph order, so that output does not depend on hash or set order.
+
+latinTiers = [
+    [(0x0020, 0x007E)],
+    [(0x00A0, 0x00FF), (0x2010, 0x2027), (0x2030, 0x203A), (0x20AC, 0x20AC)],
+    [(0x0410, 0x044F), (0x0401, 0x0401), (0x0451, 0x0451)],
+    [(0x0391, 0x03C9)],
+    [(0x0100, 0x024F)],
+]
+
+ideographs = [(0x4E00, 0x9FFF)]
+hangulSyllables = [(0xAC00, 0xD7A3)]
+
+cjkTiers = [
+    [(0x3000, 0x303F), (0xFF01, 0xFF5E)],
+]
+
+kanaTiers = [
+    [(0x3041, 0x3096), (0x30A1, 0x30FC)],
+]
+
+
+def CodeTable(codec, first, last, ranges):
+    # characters of a double-byte code table in code order, limited to
+    # `ranges` to skip symbols and unassigned codes
+    result = []
+    for code in range(first, last + 1):
+        try:
+            c = code.to_bytes(2, 'big').decode(codec)
+        except UnicodeDecodeError:
+            continue
+        if len(c) == 1 and any(lo <= ord(c) <= hi for lo, hi in ranges):
+            result.append(c)
+    return result
+
+
+def Ranges(ranges):
+    return [chr(u) for lo, hi in ranges for u in range(lo, hi + 1)]
+
+
+def FrequentCharacters(encoding):
+    # characters of an encoding, most frequent first
+    tiers = [Ranges(t) for t in latinTiers]
+    if encoding == "gbk":
+        tiers += [Ranges(t) for t in cjkTiers]
+        tiers.append(CodeTable("gb2312", 0xB0A1, 0xD7F9, ideographs))
+    elif encoding == "big5":
+        tiers += [Ranges(t) for t in cjkTiers]
+        tiers.append(CodeTable("cp950", 0xA440, 0xC67E, ideographs))
+    elif encoding == "jis":
+        tiers += [Ranges(t) for t in cjkTiers + kanaTiers]
+        tiers.append(CodeTable("cp932", 0x889F, 0x9872, ideographs))
+    elif encoding == "korean":
+        tiers += [Ranges(t) for t in cjkTiers]
+        tiers.append(CodeTable("euc_kr", 0xB0A1, 0xC8FE, hangulSyllables))
+    return [c for tier in tiers for c in tier]
+
+
+def OrderByFrequency(font, encoding):
+    cmap = font['cmap']
+    order = font['glyph_order']
+    # `.notdef` stays at glyph 0
+    ranked = order[:1]
+    seen = set(ranked)
+    present = set(order)
+    for c in FrequentCharacters(encoding):
+        name = cmap.get(str(ord(c)))
+        if name in present and name not in seen:
+            ranked.append(name)
+            seen.add(name)
+    font['glyph_order'] = ranked + [name for name in order if name not in seen]
+
+
+def SortTables(font):
+    # `cmap` by code point and `glyf` in glyph order, whatever order merging
+    # and the set iterations in libotd left them in
+    cmap = font['cmap']
+    font['cmap'] = {u: cmap[u] for u in sorted(cmap, key=int)}
+    glyf = font['glyf']
+    order = [name for name in font.get('glyph_order', []) if name in glyf]
+    listed = set(order)
+    font['glyf'] = {name: glyf[name] for name in order + sorted(n for n in glyf if n not in listed)}
+
+
+def OrderGlyphs(font, encoding):
+    if configure.config.glyphOrder == "frequency":
+        OrderByFrequency(font, encoding)
+    SortTables(font)
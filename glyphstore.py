@@ -0,0 +1,235 @@
+import sys
+import json
+import hashlib
+import configure
+import otdio
+
+# Compact storage of the Source Han Sans dumps in `build/shs/`.
+#
+# "store" mode: content-addressed store of the region dumps of one weight.
+#
+# The regional fonts share most of their outlines, so each distinct glyph is
+# stored once per weight, keyed by the hash of its canonical JSON form:
+#
+# {"glyphs": {hash: glyph}}
+#
+# Each region has a reference file of its own with all its other tables as
+# they are, and `glyf` replaced by a map from glyph name to glyph hash. CID
+# font dict selections differ between regions even when outlines do not, so
+# they are kept per region in `fdSelect`:
+#
+# {..., "glyf": {name: hash}, "fdSelect": {name: fd}}
+#
+# A merge reads the reference file of its region and the glyph store, which
+# holds the outlines of every region: more than one dump's worth, though
+# most are shared. The store is built from all region dumps of the weight, so
+# merges wait for all of them.
+#
+# "delta" mode: the dump of `Config.shsDeltaBase` is kept in full, and every
+# other region of the weight is kept as a delta against it:
+#
+# {
+#     "tables": {table: value},  # tables that differ, except `cmap` and `glyf`
+#     "removedTables": [table],
+#     "cmap": {"set": {unicode: name}, "unset": [unicode]},
+#     "glyf": {name: {"set": {field: value}, "unset": [field]}},
+#     "removedGlyphs": [name],
+# }
+#
+# Glyphs are diffed field by field, so a glyph differing only in metrics
+# costs the changed metrics.
+
+fdSelectKey = "CFF_fdSelect"
+
+
+def StorePath(weight):
+    return "build/shs/{}.json".format(configure.GenerateFilename({
+        "family": "SHS",
+        "region": "Store",
+        "weight": weight,
+        "width": 5,
+    }))
+
+
+def GlyphHash(glyph):
+    canonical = json.dumps(glyph, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def RefPath(weight, region):
+    return DumpPath(weight, region)[:-len(".otd")] + ".ref.json"
+
+
+def Ingest(glyphs, font):
+    # the reference of `font`; its glyphs are added to `glyphs`
+    glyphRef = {}
+    fdSelect = {}
+    for name, glyph in font["glyf"].items():
+        if fdSelectKey in glyph:
+            fdSelect[name] = glyph[fdSelectKey]
+            glyph = {k: v for k, v in glyph.items() if k != fdSelectKey}
+        h = GlyphHash(glyph)
+        glyphs.setdefault(h, glyph)
+        glyphRef[name] = h
+    return {
+        **{k: v for k, v in font.items() if k != "glyf"},
+        "glyf": glyphRef,
+        "fdSelect": fdSelect,
+    }
+
+
+def CopyJson(value):
+    # deep copy of a JSON value, several times faster than `copy.deepcopy`
+    if type(value) is dict:
+        return {k: CopyJson(v) for k, v in value.items()}
+    if type(value) is list:
+        return [CopyJson(v) for v in value]
+    return value
+
+
+def Reconstruct(glyphs, regionTables):
+    # names with the same outline, in one region or in several, share a glyph
+    # in the store; each gets its own copy, as merging transforms glyphs in
+    # place
+    fdSelect = regionTables["fdSelect"]
+    font = {k: v for k, v in regionTables.items() if k not in ("glyf", "fdSelect")}
+    font["glyf"] = {}
+    for name, h in regionTables["glyf"].items():
+        glyph = CopyJson(glyphs[h])
+        if name in fdSelect:
+            glyph[fdSelectKey] = fdSelect[name]
+        font["glyf"][name] = glyph
+    return font
+
+
+loadedStores = {}
+
+
+def LoadStore(path):
+    # stores are parsed once per process, so that a process loading several
+    # regions of a weight reads the shared glyphs only once
+    if path not in loadedStores:
+        loadedStores[path] = otdio.LoadOtd(path)["glyphs"]
+    return loadedStores[path]
+
+
+def LoadRegion(weight, region):
+    return Reconstruct(LoadStore(StorePath(weight)), otdio.LoadOtd(RefPath(weight, region)))
+
+
+def DumpPath(weight, region):
+    return "build/shs/{}.otd".format(configure.GenerateFilename({
+        "family": "SHS",
+        "region": region,
+        "weight": weight,
+        "width": 5,
+    }))
+
+
+def DeltaPath(weight, region):
+    return DumpPath(weight, region)[:-len(".otd")] + ".delta.json"
+
+
+def DiffMap(base, target):
+    return {
+        "set": {k: v for k, v in target.items() if k not in base or base[k] != v},
+        "unset": [k for k in base if k not in target],
+    }
+
+
+def PatchMap(base, diff):
+    unset = set(diff["unset"])
+    result = {k: v for k, v in base.items() if k not in unset}
+    result.update(diff["set"])
+    return result
+
+
+def MakeDelta(base, font):
+    baseGlyf = base["glyf"]
+    glyf = {}
+    for name, glyph in font["glyf"].items():
+        if name not in baseGlyf:
+            glyf[name] = {"set": glyph, "unset": []}
+        elif baseGlyf[name] != glyph:
+            glyf[name] = DiffMap(baseGlyf[name], glyph)
+    return {
+        "tables": {
+            k: v for k, v in font.items()
+            if k not in ("cmap", "glyf") and (k not in base or base[k] != v)
+        },
+        "removedTables": [k for k in base if k not in font],
+        "cmap": DiffMap(base["cmap"], font["cmap"]),
+        "glyf": glyf,
+        "removedGlyphs": [name for name in baseGlyf if name not in font["glyf"]],
+    }
+
+
+def ApplyDelta(base, delta):
+    # unchanged tables and glyphs are shared with `base`
+    font = {k: v for k, v in base.items() if k not in delta["removedTables"]}
+    font.update(delta["tables"])
+    font["cmap"] = PatchMap(base["cmap"], delta["cmap"])
+    removedGlyphs = set(delta["removedGlyphs"])
+    glyf = {}
+    for name, glyph in base["glyf"].items():
+        if name in removedGlyphs:
+            continue
+        glyf[name] = PatchMap(glyph, delta["glyf"][name]) if name in delta["glyf"] else glyph
+    for name, diff in delta["glyf"].items():
+        if name not in glyf:
+            glyf[name] = diff["set"]
+    font["glyf"] = glyf
+    return font
+
+
+loadedBases = {}
+
+
+def LoadRegionDelta(weight, region):
+    base = configure.config.shsDeltaBase
+    basePath = DumpPath(weight, base)
+    if basePath not in loadedBases:
+        loadedBases[basePath] = otdio.LoadOtd(basePath)
+    if region == base:
+        return loadedBases[basePath]
+    delta = otdio.LoadOtd(DeltaPath(weight, region))
+    return ApplyDelta(loadedBases[basePath], delta)
+
+
+def LoadDump(path):
+    return otdio.LoadOtd(path)
+
+
+def WriteJson(path, obj):
+    otdio.WriteOtd(path, obj)
+
+
+if __name__ == '__main__':
+    # python glyphstore.py store <store> <dump>...
+    # python glyphstore.py ref <reference> <dump>
+    # python glyphstore.py delta <delta> <base dump> <dump>
+    mode = sys.argv[1]
+    out = sys.argv[2]
+    if mode == "store":
+        glyphs = {}
+        glyphCount = 0
+        for path in sys.argv[3:]:
+            font = LoadDump(path)
+            glyphCount += len(font["glyf"])
+            Ingest(glyphs, font)
+            del font
+        print("{}: {} regions, {} glyphs, {} unique".format(
+            out, len(sys.argv) - 3, glyphCount, len(glyphs)))
+        WriteJson(out, {"glyphs": glyphs})
+    elif mode == "ref":
+        WriteJson(out, Ingest({}, LoadDump(sys.argv[3])))
+    elif mode == "delta":
+        base = LoadDump(sys.argv[3])
+        font = LoadDump(sys.argv[4])
+        delta = MakeDelta(base, font)
+        print("{}: {} of {} glyphs differ".format(
+            out, len(delta["glyf"]), len(font["glyf"])))
+        WriteJson(out, delta)
+    else:
+        print("unknown mode {}".format(mode), file=sys.stderr)
+        sys.exit(1)
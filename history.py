@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import sqlite3
+import contextlib
+import argparse
+import subprocess
+import buildtrace
+import journal
+
+# Build history in `build/history.sqlite`.
+#
+# Every build step that runs (not restored from the artifact cache) records
+# its wall time, CPU time, peak RSS and input and output sizes, keyed by the
+# kind of its node in the build graph and its target. The planner fits a
+# linear model of CPU time and peak RSS on input size per kind from it.
+#
+# python history.py run -k <kind> -o <output> [-i <input>...] -- <command>
+#     run and record a step that is not run through `cache.py`
+# python history.py report [-k <kind>]
+#     show how steps changed across versions
+
+historyPath = "build/history.sqlite"
+
+
+def Connect():
+    # the connection is not closed by `with`; use `contextlib.closing`
+    os.makedirs(os.path.dirname(historyPath), exist_ok=True)
+    # steps of a parallel build record at the same time
+    db = sqlite3.connect(historyPath, timeout=60)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS step ("
+        "time REAL, version TEXT, kind TEXT, target TEXT, "
+        "wallSeconds REAL, cpuSeconds REAL, peakRss INTEGER, "
+        "inputBytes INTEGER, outputBytes INTEGER)")
+    return db
+
+
+def Size(paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.isfile(p))
+
+
+def Measure(command):
+    # returns the exit status and (wall seconds, CPU seconds, peak RSS bytes)
+    start = time.perf_counter()
+    process = subprocess.Popen(command)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    # `ru_maxrss` is in KiB on Linux, in bytes on macOS
+    rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return process.returncode, (wall, usage.ru_utime + usage.ru_stime, rss)
+
+
+def Record(kind, outputs, inputs, measurement):
+    import configure
+    wall, cpu, rss = measurement
+    try:
+        # the inner `with` commits
+        with contextlib.closing(Connect()) as db, db:
+            db.execute("INSERT INTO step VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                time.time(), configure.config.version, kind, outputs[0],
+                wall, cpu, rss, Size(inputs), Size(outputs)))
+    except sqlite3.Error as e:
+        print("history: {}".format(e), file=sys.stderr)
+
+
+def Run(kind, outputs, inputs, command):
+    start = time.time()
+    status, measurement = Measure(command)
+    if status == 0:
+        Record(kind, outputs, inputs, measurement)
+        journal.Record(outputs)
+    buildtrace.Record(kind, outputs[0], start, time.time())
+    return status
+
+
+class Model:
+    # least squares fit of `y = a + b * inputBytes`; the mean when the input
+    # sizes do not vary
+    def __init__(self, samples):
+        n = len(samples)
+        meanX = sum(x for x, _ in samples) / n
+        meanY = sum(y for _, y in samples) / n
+        varX = sum((x - meanX) ** 2 for x, _ in samples)
+        self.slope = sum((x - meanX) * (y - meanY) for x, y in samples) / varX if varX else 0
+        self.intercept = meanY - self.slope * meanX
+        self.meanX = meanX
+
+    def Predict(self, inputBytes=None):
+        x = self.meanX if inputBytes is None else inputBytes
+        return max(0, self.intercept + self.slope * x)
+
+
+def Models():
+    # {kind: (CPU seconds model, peak RSS bytes model)} of the current version,
+    # or of all versions where the current one has too few samples
+    if not os.path.isfile(historyPath):
+        return {}
+    import configure
+    models = {}
+    with contextlib.closing(Connect()) as db:
+        kinds = [k for k, in db.execute("SELECT DISTINCT kind FROM step")]
+        for kind in kinds:
+            rows = db.execute(
+                "SELECT inputBytes, cpuSeconds, peakRss FROM step WHERE kind = ? AND version = ?",
+                (kind, configure.config.version)).fetchall()
+            if len(rows) < 3:
+                rows = db.execute(
+                    "SELECT inputBytes, cpuSeconds, peakRss FROM step WHERE kind = ?", (kind,)).fetchall()
+            models[kind] = (Model([(x, cpu) for x, cpu, _ in rows]), Model([(x, rss) for x, _, rss in rows]))
+    return models
+
+
+def LastInputBytes():
+    # {target: input bytes of its last recorded run}
+    if not os.path.isfile(historyPath):
+        return {}
+    with contextlib.closing(Connect()) as db:
+        return dict(db.execute("SELECT target, inputBytes FROM step ORDER BY time"))
+
+
+def Report(kind=None):
+    if not os.path.isfile(historyPath):
+        print("no build history in {}".format(historyPath), file=sys.stderr)
+        return 1
+    query = (
+        "SELECT version, kind, COUNT(*), AVG(wallSeconds), AVG(cpuSeconds), MAX(peakRss), "
+        "AVG(inputBytes), AVG(outputBytes), MIN(time) FROM step {}"
+        "GROUP BY version, kind ORDER BY kind, MIN(time)")
+    with contextlib.closing(Connect()) as db:
+        if kind:
+            rows = db.execute(query.format("WHERE kind = ? "), (kind,)).fetchall()
+        else:
+            rows = db.execute(query.format("")).fetchall()
+
+    print("{:<10}{:<10}{:>8}{:>10}{:>10}{:>12}{:>12}{:>12}".format(
+        "kind", "version", "steps", "wall (s)", "CPU (s)", "RSS (MiB)", "in (MiB)", "out (MiB)"))
+    previous = None
+    for version, k, count, wall, cpu, rss, inputBytes, outputBytes, _ in rows:
+        if previous is not None and previous != k:
+            print()
+        previous = k
+        print("{:<10}{:<10}{:>8}{:>10.1f}{:>10.1f}{:>12.0f}{:>12.1f}{:>12.1f}".format(
+            k, version, count, wall, cpu, rss / (1 << 20), inputBytes / (1 << 20), outputBytes / (1 << 20)))
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Record and report build step costs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    runParser = sub.add_parser("run", help="run a build step and record its cost")
+    runParser.add_argument("-k", "--kind", required=True, help="kind of the step in the build graph")
+    runParser.add_argument("-o", "--output", action="append", required=True,
+                           help="file written by the step")
+    runParser.add_argument("-i", "--input", nargs="*", default=[],
+                           help="files read by the step")
+    runParser.add_argument("step", nargs=argparse.REMAINDER,
+                           help="the step command, after `--`")
+    reportParser = sub.add_parser("report", help="show step costs by version")
+    reportParser.add_argument("-k", "--kind", help="only show steps of this kind")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        step = args.step[1:] if args.step[:1] == ["--"] else args.step
+        if not step:
+            parser.error("no step command given")
+        sys.exit(Run(args.kind, args.output, args.input, step))
+    else:
+        sys.exit(Report(args.kind))
@@ -0,0 +1,82 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import configure
+import cache
+
+# Dump source fonts with otfccdump through the artifact cache (`cache.py`).
+#
+# The dumps are keyed by the content of the source font, so they survive
+# `make clean`, and an unchanged Adobe or Iosevka source is never dumped twice.
+#
+# python ingest.py <source> <dump> <glyph name prefix>
+#     dump one source font, as the Makefile rules do
+# python ingest.py --all [-j <jobs>]
+#     dump every source font in a process pool
+
+requiredTables = ["head", "hhea", "OS_2", "maxp", "cmap", "glyf", "glyph_order"]
+
+
+def DumpCommand(source, dump, prefix):
+    return ["otfccdump", "--glyph-name-prefix", prefix, "--ignore-hints", source, "-o", dump]
+
+
+def Validate(outputs):
+    # a cheap structural check: a truncated or failed dump lacks its closing
+    # brace or some of the tables
+    for path in outputs:
+        try:
+            with open(path, 'rb') as dumpFile:
+                data = dumpFile.read()
+        except FileNotFoundError:
+            print("{}: not written".format(path), file=sys.stderr)
+            return False
+        data = data.strip()
+        missing = [t for t in requiredTables if '"{}":'.format(t).encode() not in data]
+        if not (data.startswith(b'{') and data.endswith(b'}')) or missing:
+            print("{}: invalid dump{}".format(
+                path, ", missing " + ", ".join(missing) if missing else ""), file=sys.stderr)
+            os.remove(path)
+            return False
+    return True
+
+
+def Dump(job):
+    source, dump, prefix = job
+    os.makedirs(os.path.dirname(dump), exist_ok=True)
+    return cache.Run([dump], [source], DumpCommand(source, dump, prefix), Validate, kind="dump")
+
+
+def DumpAll(jobs):
+    todo = []
+    status = 0
+    for dump, (source, prefix) in configure.GetSourceDumps().items():
+        if os.path.exists(source):
+            todo.append((source, dump, prefix))
+        else:
+            print("{}: missing".format(source), file=sys.stderr)
+            status = 1
+
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for (source, dump, _), result in zip(todo, pool.map(Dump, todo)):
+            if result != 0:
+                print("{}: failed".format(source), file=sys.stderr)
+                status = 1
+    print("{} source fonts ingested".format(len(todo)))
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Dump source fonts through the artifact cache.")
+    parser.add_argument("--all", action="store_true", help="dump every source font")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of dumps to run in parallel with --all")
+    parser.add_argument("job", nargs="*", help="<source> <dump> <glyph name prefix>")
+    args = parser.parse_args()
+
+    if args.all:
+        sys.exit(DumpAll(args.jobs))
+    if len(args.job) != 3:
+        parser.error("expected <source> <dump> <glyph name prefix>")
+    sys.exit(Dump(args.job))
@@ -0,0 +1,33 @@
+# Materialize a font pack from a Nowar release archive.
+#
+# usage: python install.py <pack> [<destination>]
+#
+# e.g. `python install.py NowarDIN-CN-400 "World of Warcraft/_retail_"`
+# writes the fonts to `World of Warcraft/_retail_/Fonts/`.
+
+import os
+import sys
+import json
+import shutil
+
+if __name__ == '__main__':
+    root = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(root, "manifest.json"), encoding='UTF-8') as mf:
+        manifest = json.load(mf)
+
+    if len(sys.argv) < 2 or sys.argv[1] not in manifest["packs"]:
+        print("usage: python install.py <pack> [<destination>]")
+        print("available packs in {}:".format(manifest["version"]))
+        for name in manifest["packs"]:
+            print("  " + name)
+        sys.exit(1)
+
+    name = sys.argv[1]
+    dest = os.path.join(sys.argv[2] if len(sys.argv) > 2 else name, "Fonts")
+    os.makedirs(dest, exist_ok=True)
+    for slot, digest in manifest["packs"][name].items():
+        shutil.copyfile(os.path.join(root, "blobs", digest + ".ttf"),
+                        os.path.join(dest, slot + ".ttf"))
+    shutil.copyfile(os.path.join(root, "LICENSE.txt"),
+                    os.path.join(dest, "LICENSE.txt"))
+    print("{} installed to {}".format(name, dest))
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+
+# Journal of completed build steps in `build/journal.jsonl`.
+#
+# Steps run through `cache.py` or `history.py` append the size and mtime of
+# their outputs once they have succeeded. After a build was interrupted, e.g.
+# by a crashed machine, `make verify` removes the outputs that are not in the
+# journal as written, so that the next make run redoes exactly the partial
+# work and keeps everything that completed.
+
+journalPath = "build/journal.jsonl"
+
+
+def Record(outputs):
+    lines = []
+    for path in outputs:
+        stat = os.stat(path)
+        lines.append(json.dumps({"path": path, "size": stat.st_size, "mtime": stat.st_mtime_ns}) + "\n")
+    os.makedirs(os.path.dirname(journalPath), exist_ok=True)
+    # one append per step; steps of a parallel build do not interleave
+    with open(journalPath, 'a') as f:
+        f.write("".join(lines))
+
+
+def Load():
+    entries = {}
+    with open(journalPath) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of a journal cut off by a crash
+                continue
+            entries[entry["path"]] = entry
+    return entries
+
+
+def IsComplete(path, entry):
+    stat = os.stat(path)
+    return entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns
+
+
+def Verify(graph):
+    if not os.path.isfile(journalPath):
+        print("{}: no journal, nothing verified".format(journalPath), file=sys.stderr)
+        return 1
+    entries = Load()
+    version = str(graph.variable["VERSION"])
+    removed = 0
+    for node in graph.nodes.values():
+        if node.kind in ("phony", "task"):
+            continue
+        path = node.target.replace("${VERSION}", version)
+        if not os.path.isfile(path):
+            continue
+        if node.kind == "copy":
+            # copies are not journaled; a complete copy has the size of its
+            # source, unless the source was evicted
+            source = node.inputs[0].replace("${VERSION}", version)
+            complete = not os.path.isfile(source) or os.path.getsize(source) == os.path.getsize(path)
+        else:
+            complete = IsComplete(path, entries.get(path))
+        if not complete:
+            print("{}: incomplete, removed".format(path))
+            os.remove(path)
+            removed += 1
+    print("{} incomplete outputs removed".format(removed))
+    return 0
+
+
+if __name__ == '__main__':
+    import configure
+    sys.exit(Verify(configure.BuildGraph()))
@@ -1,16 +1,33 @@
 import datetime
+import os
 import sys
 import copy
 import json
-import codecs
+import hashlib
 from libotd.rebase import Rebase
 from libotd.dereference import Dereference
 from libotd.merge import MergeBelow, MergeAbove
 from libotd.pkana import ApplyPalt, NowarApplyPaltMultiplied
 from libotd.transform import Transform, ChangeAdvanceWidth
-from libotd.gsub import GetGsubFlat, ApplyGsubSingle
+from libotd.gsub import GetGsubFlat
 from libotd.gc import Gc, Consolidate, NowarRemoveFeatures
 import configure
+import glyphstore
+import otdio
+from glyphorder import OrderGlyphs
+from outline import SimplifyOutline
+
+
+def FontTimestamp():
+    # `head` dates count seconds since 1904-01-01.
+    # SOURCE_DATE_EPOCH is honoured for reproducible builds.
+    epoch = datetime.datetime(1904, 1, 1, tzinfo=datetime.timezone.utc)
+    if "SOURCE_DATE_EPOCH" in os.environ:
+        date = datetime.datetime.fromtimestamp(
+            int(os.environ["SOURCE_DATE_EPOCH"]), datetime.timezone.utc)
+    else:
+        date = datetime.datetime.now(datetime.timezone.utc)
+    return int((date - epoch).total_seconds())
 
 
 def NameFont(param, font):
@@ -31,6 +48,10 @@ def NameFont(param, font):
     slant = param.get("slant")
 
     head['fontRevision'] = configure.config.fontRevision
+    # kept by `otfccbuild --keep-modified-time`
+    head['modified'] = FontTimestamp()
+    if "SOURCE_DATE_EPOCH" in os.environ:
+        head['created'] = head['modified']
     os_2['achVendID'] = configure.config.vendorId
     os_2['usWeightClass'] = weight
     # Warcraft numeral hack
@@ -205,6 +226,29 @@ def NameFont(param, font):
         cff['weight'] = subfamily
 
 
+def NameStampPath(filename):
+    return "build/name/{}.json".format(filename)
+
+
+def ReadNameStamp(filename):
+    try:
+        with open(NameStampPath(filename), 'rb') as stampFile:
+            return json.loads(stampFile.read().decode('UTF-8'))
+    except FileNotFoundError:
+        return None
+
+
+def WriteNameStamp(param):
+    # record the `Config` naming fields the font was named with, so that
+    # `refresh-name.py` can tell whether a rename is enough
+    stamp = {
+        "param": param,
+        "name": configure.NameConfigStamp(),
+    }
+    os.makedirs("build/name", exist_ok=True)
+    otdio.WriteText(NameStampPath(configure.GenerateFilename(param)), json.dumps(stamp, ensure_ascii=False))
+
+
 def GenerateAsianSymbolFont(font):
     asianSymbol = [
         0x00B7,  # MIDDLE DOT
@@ -220,15 +264,99 @@ def GenerateAsianSymbolFont(font):
         0x2E3B,  # THREE-EM DASH
     ]
     symbolFont = {}
-    symbolFont["cmap"] = {k: v for k,
-                          v in font["cmap"].items() if int(k) in asianSymbol}
-    glyphSet = {symbolFont["cmap"].values()}
-    symbolFont["glyf"] = {k: v for k,
-                          v in font["glyf"].items() if k in glyphSet}
+    symbolFont["cmap"] = {
+        str(u): font["cmap"][str(u)] for u in asianSymbol if str(u) in font["cmap"]}
+    # glyphs in code point order, not in the order of a set
+    glyphNames = dict.fromkeys(symbolFont["cmap"].values())
+    symbolFont["glyf"] = {k: font["glyf"][k] for k in glyphNames}
     symbolFont["glyph_order"] = ["symb.notdef"]
     return symbolFont
 
 
+def AsianFontSources(dep):
+    if configure.config.shsStorage == "store":
+        return [glyphstore.RefPath(dep['weight'], dep['region']), glyphstore.StorePath(dep['weight'])]
+    if configure.config.shsStorage == "delta":
+        base = glyphstore.DumpPath(dep['weight'], configure.config.shsDeltaBase)
+        if dep['region'] == configure.config.shsDeltaBase:
+            return [base]
+        return [base, glyphstore.DeltaPath(dep['weight'], dep['region'])]
+    return ["build/shs/{}.otd".format(configure.GenerateFilename(dep))]
+
+
+def LoadAsianFont(dep):
+    if configure.config.shsStorage == "store":
+        return glyphstore.LoadRegion(dep['weight'], dep['region'])
+    if configure.config.shsStorage == "delta":
+        return glyphstore.LoadRegionDelta(dep['weight'], dep['region'])
+    return otdio.LoadOtd("build/shs/{}.otd".format(configure.GenerateFilename(dep)))
+
+
+def GsubFlatPath(source):
+    return source[:-len(".otd")] + ".gsub.json"
+
+
+loadedGsubFlat = {}
+
+
+def GsubFlatKey(source):
+    # the content of the dump and of the code flattening it, as for the
+    # artifact cache (`cache.py`)
+    h = hashlib.sha256()
+    for path in [source, sys.modules[GetGsubFlat.__module__].__file__]:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def GetGsubFlatCached(tag, font, source):
+    # flattened single substitutions of `tag` in the font dumped to `source`,
+    # kept next to the dump while its content is unchanged
+    if source not in loadedGsubFlat:
+        key = GsubFlatKey(source)
+        cached = {"key": key, "features": {}}
+        try:
+            saved = otdio.LoadOtd(GsubFlatPath(source))
+            if saved["key"] == key:
+                cached = saved
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        loadedGsubFlat[source] = cached
+
+    cached = loadedGsubFlat[source]
+    if tag not in cached["features"]:
+        cached["features"][tag] = GetGsubFlat(tag, font)
+        # merges of the same source font run in parallel
+        otdio.WriteOtd(GsubFlatPath(source), cached)
+    return cached["features"][tag]
+
+
+def ComposeGsubFlat(tags, font, source=None):
+    # single substitutions of `tags`, applied in order, as one map
+    composed = {}
+    for tag in tags:
+        flat = GetGsubFlatCached(tag, font, source) if source else GetGsubFlat(tag, font)
+        composed = {g: flat.get(s, s) for g, s in composed.items()}
+        for g, s in flat.items():
+            composed.setdefault(g, s)
+    return composed
+
+
+def ApplyGsub(tags, font, source=None):
+    composed = ComposeGsubFlat(tags, font, source)
+    cmap = font['cmap']
+    for u, g in cmap.items():
+        if g in composed:
+            cmap[u] = composed[g]
+
+
+def FlattenFeatures(font):
+    ApplyGsub(configure.config.flattenFeatureTags, font)
+    for table in ("GSUB", "GPOS", "GDEF"):
+        font.pop(table, None)
+
+
 def Simplify(font):
     from opencc_t2s import OpenCC_T2S
     cmap = asianFont['cmap']
@@ -245,9 +373,13 @@ if __name__ == '__main__':
 
     dep = configure.ResolveDependency(param)
 
-    with open("build/lcg/{}.otd".format(configure.GenerateFilename(dep['Latin'])), 'rb') as baseFile:
-        baseFont = json.loads(
-            baseFile.read().decode('UTF-8', errors='replace'))
+    basePath = "build/lcg/{}.otd".format(configure.GenerateFilename(dep['Latin']))
+    numPath = "build/lcg/{}.otd".format(configure.GenerateFilename(dep['Numeral'])) if "Numeral" in dep else None
+    # read the numeral and CJK fonts while the base font is parsed and named
+    otdio.Prefetch([basePath] + ([numPath] if param["width"] == 10 else []) +
+                   AsianFontSources(dep['CJK']))
+
+    baseFont = otdio.LoadOtd(basePath)
     upm = baseFont["head"]["unitsPerEm"]
     if (upm != 1000):
         Rebase(baseFont, 1000 / upm, roundToInt=True)
@@ -267,40 +399,36 @@ if __name__ == '__main__':
     os_2['usWinAscent'] = 1050
     os_2['usWinDescent'] = 300
 
+    tags = []
     # oldstyle figure
     if "OSF" in param["feature"]:
-        ApplyGsubSingle('pnum', baseFont)
-        ApplyGsubSingle('onum', baseFont)
-
+        tags += ['pnum', 'onum']
     # small caps
     if "SC" in param["feature"]:
-        ApplyGsubSingle('smcp', baseFont)
+        tags.append('smcp')
+    ApplyGsub(tags, baseFont, basePath)
 
     # Warcraft numeral hack
     if param["width"] == 10:
-        with open("build/lcg/{}.otd".format(configure.GenerateFilename(dep['Numeral'])), 'rb') as numFile:
-            numFont = json.loads(
-                numFile.read().decode('UTF-8', errors='replace'))
-            if (upm != 1000):
-                Rebase(numFont, 1000 / upm, roundToInt=True)
-
-            gsubOnum = GetGsubFlat('onum', numFont)
+        numFont = otdio.LoadOtd(numPath)
+        if (upm != 1000):
+            Rebase(numFont, 1000 / upm, roundToInt=True)
 
-            num = [numFont['cmap'][str(ord('0') + i)] for i in range(10)]
-            onum = [gsubOnum[n] for n in num]
+        gsubOnum = GetGsubFlatCached('onum', numFont, numPath)
 
-            # dereference TT glyphs
-            if "CFF_" not in numFont:
-                for n in num + onum:
-                    numFont['glyf'][n] = Dereference(
-                        numFont['glyf'][n], numFont)
+        num = [numFont['cmap'][str(ord('0') + i)] for i in range(10)]
+        onum = [gsubOnum[n] for n in num]
 
+        # dereference TT glyphs
+        if "CFF_" not in numFont:
             for n in num + onum:
-                baseFont['glyf'][n] = numFont['glyf'][n]
+                numFont['glyf'][n] = Dereference(
+                    numFont['glyf'][n], numFont)
 
-    with open("build/shs/{}.otd".format(configure.GenerateFilename(dep['CJK'])), 'rb') as asianFile:
-        asianFont = json.loads(
-            asianFile.read().decode('UTF-8', errors='replace'))
+        for n in num + onum:
+            baseFont['glyf'][n] = numFont['glyf'][n]
+
+    asianFont = LoadAsianFont(dep['CJK'])
 
     # pre-apply `palt` in UI family
     if "UI" in param["feature"]:
@@ -321,8 +449,15 @@ if __name__ == '__main__':
     if "RP" in param["feature"]:
         baseFont['cmap'][str(ord('丶'))] = baseFont['cmap'][str(ord('·'))]
 
+    if configure.config.flattenFeatures:
+        FlattenFeatures(baseFont)
+
     Gc(baseFont)
     Consolidate(baseFont)
-    outStr = json.dumps(baseFont, ensure_ascii=False, separators=(',', ':'))
-    with codecs.open("build/nowar/{}.otd".format(configure.GenerateFilename(param)), 'w', 'UTF-8') as outFile:
-        outFile.write(outStr)
+    if configure.config.simplifyOutline:
+        before, after = SimplifyOutline(baseFont, configure.config.simplifyTolerance)
+        print("{}: {} of {} points removed ({:.1%})".format(
+            configure.GenerateFilename(param), before - after, before, (before - after) / max(before, 1)))
+    OrderGlyphs(baseFont, param["encoding"])
+    otdio.WriteOtd("build/nowar/{}.otd".format(configure.GenerateFilename(param)), baseFont)
+    WriteNameStamp(param)
@@ -0,0 +1,236 @@
+import os
+import re
+import gc
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Reading and writing otfcc JSON documents.
+#
+# Documents are written to a temporary file in the same directory, flushed to
+# disk and renamed over the target, so that a build killed mid-write never
+# leaves a truncated document that make takes as up to date.
+#
+# Documents needed later can be read ahead in background threads with
+# `Prefetch`; file reads release the GIL, so they overlap with the CPU work on
+# the documents loaded first. `ReadBytes` takes the prefetched data.
+#
+# Documents are parsed from bytes by the fastest JSON library installed:
+# orjson, simdjson (pysimdjson), ujson, or the standard library. They are
+# written as `json.dumps(font, ensure_ascii=False, separators=(',', ':'))`
+# writes them, by orjson where its output is the same: it writes floats
+# below 1e-4 or from 1e16 up in another form, writes NaN and infinities as
+# null, and rejects keys that are not strings and integers of more than 64
+# bits; documents with any of those, or with any null, are written by the
+# standard library. `NOWAR_JSON=<backend>` picks the backend.
+#
+# python otdio.py benchmark [-r <repeat>] <document>...
+#     compare the installed backends on large documents, e.g. a Source Han
+#     Sans dump
+
+prefetcher = None
+prefetched = {}
+
+
+def ReadFile(path):
+    with open(path, 'rb') as inFile:
+        # readahead hints; not available on every platform
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(inFile.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                os.posix_fadvise(inFile.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            except OSError:
+                pass
+        return inFile.read()
+
+
+def Prefetch(paths):
+    global prefetcher
+    if prefetcher is None:
+        prefetcher = ThreadPoolExecutor(4, thread_name_prefix="prefetch")
+    for path in paths:
+        if path not in prefetched and os.path.isfile(path):
+            prefetched[path] = prefetcher.submit(ReadFile, path)
+
+
+def ReadBytes(path):
+    future = prefetched.pop(path, None)
+    if future is None:
+        return ReadFile(path)
+    return future.result()
+
+
+def JsonLoads(data):
+    # dumps may carry invalid UTF-8 in names
+    return json.loads(data.decode('UTF-8', errors='replace'))
+
+
+def JsonDumps(font):
+    return json.dumps(font, ensure_ascii=False, separators=(',', ':')).encode('UTF-8')
+
+
+# exponents and leading zeros of numbers in orjson output that the standard
+# library writes in another form; also found in strings
+orjsonExponent = re.compile(rb"e[-1-9]")
+orjsonSmallFloat = b"0.0000"
+
+
+def IsNumberAt(data, position):
+    # in compact output, a number follows ":", "," or "["
+    start = position
+    while start > 0 and data[start - 1] in b"0123456789.-":
+        start -= 1
+    return start > 0 and data[start - 1] in b":,["
+
+
+def HasOrjsonFloat(data):
+    # literal searches are fast; a regular expression matching the numbers
+    # themselves takes longer than the dump
+    for m in orjsonExponent.finditer(data):
+        if m.start() > 0 and data[m.start() - 1] in b"0123456789" and IsNumberAt(data, m.start()):
+            return True
+    position = data.find(orjsonSmallFloat)
+    while position >= 0:
+        if IsNumberAt(data, position):
+            return True
+        position = data.find(orjsonSmallFloat, position + 1)
+    return False
+
+
+def Backends():
+    # {name: (loads(bytes), dumps(font) -> bytes)}, fastest first
+    backends = {}
+    try:
+        import orjson
+
+        def OrjsonLoads(data):
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                return JsonLoads(data)
+
+        def OrjsonDumps(font):
+            try:
+                data = orjson.dumps(font)
+            except TypeError:
+                return JsonDumps(font)
+            # null is also NaN or an infinity, which the standard library
+            # writes as `NaN` and `Infinity`
+            if b"null" in data or HasOrjsonFloat(data):
+                return JsonDumps(font)
+            return data
+
+        backends["orjson"] = (OrjsonLoads, OrjsonDumps)
+    except ImportError:
+        pass
+    try:
+        import simdjson
+
+        def SimdjsonLoads(data):
+            try:
+                return simdjson.loads(data)
+            except ValueError:
+                return JsonLoads(data)
+
+        # no writer
+        backends["simdjson"] = (SimdjsonLoads, JsonDumps)
+    except ImportError:
+        pass
+    try:
+        import ujson
+
+        def UjsonLoads(data):
+            try:
+                return ujson.loads(data)
+            except ValueError:
+                return JsonLoads(data)
+
+        # its float form is not the standard library's
+        backends["ujson"] = (UjsonLoads, JsonDumps)
+    except ImportError:
+        pass
+    backends["json"] = (JsonLoads, JsonDumps)
+    return backends
+
+
+backends = Backends()
+backend = os.environ.get("NOWAR_JSON", next(iter(backends)))
+if backend not in backends:
+    print("otdio: JSON backend {} not available, using json".format(backend), file=sys.stderr)
+    backend = "json"
+Loads, Dumps = backends[backend]
+
+
+def Parse(loads, data):
+    # parsing allocates millions of objects, none of them in cycles; garbage
+    # collections triggered meanwhile only cost time
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return loads(data)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def LoadOtd(path):
+    return Parse(Loads, ReadBytes(path))
+
+
+def WriteBytes(path, data):
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    try:
+        with open(tmp, 'wb') as outFile:
+            outFile.write(data)
+            outFile.flush()
+            os.fsync(outFile.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def WriteText(path, text):
+    WriteBytes(path, text.encode('UTF-8'))
+
+
+def WriteOtd(path, font):
+    WriteBytes(path, Dumps(font))
+
+
+def Benchmark(paths, repeat):
+    def Best(function, *args):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function(*args)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    for path in paths:
+        data = ReadFile(path)
+        reference = JsonDumps(JsonLoads(data))
+        print("{} ({:.1f} MiB)".format(path, len(data) / (1 << 20)))
+        print("    {:<10}{:>12}{:>12}  {}".format("backend", "load (s)", "dump (s)", "output"))
+        for name, (loads, dumps) in backends.items():
+            loadTime, font = Best(Parse, loads, data)
+            dumpTime, output = Best(dumps, font)
+            print("    {:<10}{:>12.3f}{:>12.3f}  {}".format(
+                name, loadTime, dumpTime, "identical" if output == reference else "DIFFERS"))
+            del font, output
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Read and write otfcc JSON documents.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    benchmarkParser = sub.add_parser("benchmark", help="compare the JSON backends")
+    benchmarkParser.add_argument("-r", "--repeat", type=int, default=3,
+                                 help="rounds per backend, the best is reported")
+    benchmarkParser.add_argument("document", nargs="+", help="otfcc JSON document")
+    args = parser.parse_args()
+    sys.exit(Benchmark(args.document, args.repeat))
@@ -0,0 +1,97 @@
+import math
+
+# Outline simplification (`Config.simplifyOutline`).
+#
+# Rounding in `Rebase` and the advance transforms of `palt` leave redundant
+# points in merged glyphs. Runs of on-curve points are simplified with the
+# Douglas-Peucker algorithm: a point is removed only where it lies within the
+# tolerance of the segment between the points kept around it, so that the
+# error does not add up over a run. This also removes duplicate points.
+# Contours left without area are dropped. Off-curve points and the on-curve
+# points next to them are never touched, so curves keep their shape and ends.
+# Glyphs with hints or instructions are left as they are, as those refer to
+# points by index.
+
+
+def Distance(a, b):
+    return math.hypot(b["x"] - a["x"], b["y"] - a["y"])
+
+
+def SegmentDistance(p, a, b):
+    dx = b["x"] - a["x"]
+    dy = b["y"] - a["y"]
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return Distance(a, p)
+    t = min(max(((p["x"] - a["x"]) * dx + (p["y"] - a["y"]) * dy) / length2, 0), 1)
+    return math.hypot(p["x"] - a["x"] - t * dx, p["y"] - a["y"] - t * dy)
+
+
+def KeepRun(points, run, keep, tolerance):
+    # Douglas-Peucker over the point indices `run`, whose ends are kept
+    stack = [(0, len(run) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a = points[run[first]]
+        b = points[run[last]]
+        distance = -1
+        for k in range(first + 1, last):
+            d = SegmentDistance(points[run[k]], a, b)
+            if d > distance:
+                distance, farthest = d, k
+        if distance > tolerance:
+            keep[run[farthest]] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+
+def SimplifyContour(contour, tolerance):
+    points = list(contour)
+    n = len(points)
+    if n < 3:
+        return points
+    keep = [not p["on"] or not points[i - 1]["on"] or not points[(i + 1) % n]["on"] for i, p in enumerate(points)]
+    if not all(p["on"] for p in points):
+        start = keep.index(True)
+    else:
+        # a polygon: split it at its lowest leftmost point, which never lies
+        # between its neighbours, and the point farthest from there
+        start = min(range(n), key=lambda i: (points[i]["x"], points[i]["y"]))
+        far = max(range(n), key=lambda i: Distance(points[start], points[i]))
+        keep[start] = keep[far] = True
+    # runs between kept points, around the contour and back to the start
+    run = [start]
+    for step in range(1, n + 1):
+        i = (start + step) % n
+        run.append(i)
+        if keep[i]:
+            if len(run) > 2:
+                KeepRun(points, run, keep, tolerance)
+            run = [i]
+    return [p for p, k in zip(points, keep) if k]
+
+
+def IsDegenerate(contour):
+    return len(contour) < 3 and all(p["on"] for p in contour)
+
+
+def SimplifyGlyph(glyph, tolerance):
+    if glyph.get("hintMasks") or glyph.get("contourMasks") or glyph.get("instructions"):
+        return
+    contours = [SimplifyContour(c, tolerance) for c in glyph["contours"]]
+    glyph["contours"] = [c for c in contours if not IsDegenerate(c)]
+
+
+def PointCount(font):
+    return sum(len(c) for glyph in font["glyf"].values() for c in glyph.get("contours", []))
+
+
+def SimplifyOutline(font, tolerance):
+    # returns the point counts before and after
+    before = PointCount(font)
+    for glyph in font["glyf"].values():
+        if glyph.get("contours"):
+            SimplifyGlyph(glyph, tolerance)
+    return before, PointCount(font)
@@ -0,0 +1,272 @@
+import os
+import lzma
+import zlib
+import struct
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# 7z property ids
+kEnd = 0x00
+kHeader = 0x01
+kMainStreamsInfo = 0x04
+kFilesInfo = 0x05
+kPackInfo = 0x06
+kUnPackInfo = 0x07
+kSubStreamsInfo = 0x08
+kSize = 0x09
+kCRC = 0x0A
+kFolder = 0x0B
+kCodersUnPackSize = 0x0C
+kNumUnPackStream = 0x0D
+kEmptyStream = 0x0E
+kName = 0x11
+kMTime = 0x14
+kAttributes = 0x15
+
+kLzma2CoderId = b'\x21'
+kFileAttributeDirectory = 0x10
+kFileAttributeArchive = 0x20
+
+# the external `7z a -m0=LZMA:d=512m:fb=273` step used a 512 MiB dictionary.
+# members are compressed independently here, so a dictionary larger than the
+# member itself is only wasted memory.
+maxDictSize = 512 << 20
+minDictSize = 1 << 16
+niceLen = 273
+# bt4 match finder + LZMA2 encoder, in bytes per byte of dictionary
+encoderMemoryFactor = 12
+
+blobDir = "build/pack"
+
+
+def WriteNumber(n):
+    for extra in range(8):
+        if n < 1 << (7 * (extra + 1)):
+            high = n >> (8 * extra)
+            mask = (0xFF00 >> extra) & 0xFF
+            return bytes([mask | high]) + n.to_bytes(8, 'little')[:extra]
+    return b'\xFF' + n.to_bytes(8, 'little')
+
+
+def WriteBitField(bits):
+    result = bytearray((len(bits) + 7) // 8)
+    for i, b in enumerate(bits):
+        if b:
+            result[i // 8] |= 0x80 >> (i % 8)
+    return bytes(result)
+
+
+def WriteProperty(pid, data):
+    return bytes([pid]) + WriteNumber(len(data)) + data
+
+
+def DictSize(size, memoryLimit):
+    dictSize = minDictSize
+    while dictSize < size and dictSize < maxDictSize:
+        dictSize <<= 1
+    while dictSize > minDictSize and dictSize * encoderMemoryFactor > memoryLimit:
+        dictSize >>= 1
+    return dictSize
+
+
+def Lzma2DictProperty(dictSize):
+    for p in range(40):
+        if (2 | (p & 1)) << (p // 2 + 11) >= dictSize:
+            return p
+    return 40
+
+
+def FileTime(mtime):
+    return (int(mtime) + 11644473600) * 10000000
+
+
+def MemberTime(path):
+    # clamp to SOURCE_DATE_EPOCH for reproducible archives
+    mtime = os.path.getmtime(path)
+    if "SOURCE_DATE_EPOCH" in os.environ:
+        mtime = min(mtime, int(os.environ["SOURCE_DATE_EPOCH"]))
+    return mtime
+
+
+def Compress(job):
+    # `job` holds the content path, the number of copies stored in the folder
+    # and the per-worker memory limit.
+    path, copies, memoryLimit = job
+    with open(path, 'rb') as f:
+        data = f.read()
+    dictSize = DictSize(len(data) * copies, memoryLimit)
+    filters = [{
+        "id": lzma.FILTER_LZMA2,
+        "preset": 9 | lzma.PRESET_EXTREME,
+        "dict_size": dictSize,
+        "nice_len": niceLen,
+    }]
+    compressor = lzma.LZMACompressor(format=lzma.FORMAT_RAW, filters=filters)
+    packed = b"".join([compressor.compress(data) for _ in range(copies)]) + compressor.flush()
+    return Lzma2DictProperty(dictSize), packed
+
+
+def BlobPath(digest, copies):
+    return os.path.join(blobDir, "{}-{}.lzma2".format(digest, copies))
+
+
+def LoadBlob(path):
+    with open(path, 'rb') as f:
+        prop = f.read(1)[0]
+        return prop, f.read()
+
+
+def SaveBlob(path, prop, packed):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(bytes([prop]))
+        f.write(packed)
+    os.replace(tmp, path)
+
+
+def HashFile(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def CollectMembers(root):
+    base = os.path.basename(os.path.normpath(root))
+    directories = [(base, MemberTime(root))]
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        rel = os.path.relpath(dirpath, root)
+        prefix = base if rel == "." else "/".join([base, *rel.split(os.sep)])
+        for d in dirnames:
+            directories.append(
+                (prefix + "/" + d, MemberTime(os.path.join(dirpath, d))))
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            files.append((prefix + "/" + name, path))
+    return directories, files
+
+
+def WriteArchive(out, directories, folders):
+    # `folders` is a list of (lzma2 property, packed bytes, [(name, path, size, crc, mtime)])
+    names = [name for name, _ in directories] + \
+        [m[0] for _, _, members in folders for m in members]
+    mtimes = [mtime for _, mtime in directories] + \
+        [m[4] for _, _, members in folders for m in members]
+    attributes = [kFileAttributeDirectory] * len(directories) + \
+        [kFileAttributeArchive] * (len(names) - len(directories))
+    emptyStream = [True] * len(directories) + \
+        [False] * (len(names) - len(directories))
+
+    header = bytearray([kHeader, kMainStreamsInfo])
+
+    header += bytes([kPackInfo]) + WriteNumber(0) + WriteNumber(len(folders))
+    header += bytes([kSize])
+    for _, packed, _ in folders:
+        header += WriteNumber(len(packed))
+    header += bytes([kEnd])
+
+    header += bytes([kUnPackInfo, kFolder]) + \
+        WriteNumber(len(folders)) + b'\x00'
+    for prop, _, _ in folders:
+        # one simple coder with attributes
+        header += WriteNumber(1) + bytes([0x20 | len(kLzma2CoderId)]) + \
+            kLzma2CoderId + WriteNumber(1) + bytes([prop])
+    header += bytes([kCodersUnPackSize])
+    for _, _, members in folders:
+        header += WriteNumber(sum(m[2] for m in members))
+    header += bytes([kEnd])
+
+    header += bytes([kSubStreamsInfo, kNumUnPackStream])
+    for _, _, members in folders:
+        header += WriteNumber(len(members))
+    header += bytes([kSize])
+    for _, _, members in folders:
+        for m in members[:-1]:
+            header += WriteNumber(m[2])
+    header += bytes([kCRC, 1])
+    for _, _, members in folders:
+        for m in members:
+            header += struct.pack('<I', m[3])
+    header += bytes([kEnd])
+
+    header += bytes([kEnd])
+
+    header += bytes([kFilesInfo]) + WriteNumber(len(names))
+    if len(directories):
+        header += WriteProperty(kEmptyStream, WriteBitField(emptyStream))
+    header += WriteProperty(kName, b'\x00' + b"".join(
+        (n + "\0").encode('UTF-16LE') for n in names))
+    header += WriteProperty(kMTime, b'\x01\x00' + b"".join(
+        struct.pack('<Q', FileTime(t)) for t in mtimes))
+    header += WriteProperty(kAttributes, b'\x01\x00' + b"".join(
+        struct.pack('<I', a) for a in attributes))
+    header += bytes([kEnd])
+
+    header += bytes([kEnd])
+    header = bytes(header)
+
+    packSize = sum(len(packed) for _, packed, _ in folders)
+    startHeader = struct.pack('<QQI', packSize, len(header), zlib.crc32(header))
+    tmp = "{}.{}.tmp".format(out, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(b'7z\xBC\xAF\x27\x1C\x00\x04')
+        f.write(struct.pack('<I', zlib.crc32(startHeader)))
+        f.write(startHeader)
+        for _, packed, _ in folders:
+            f.write(packed)
+        f.write(header)
+    os.replace(tmp, out)
+
+
+def Pack(out, root, jobs, memoryLimit):
+    directories, files = CollectMembers(root)
+
+    # identical fonts (e.g. `skurri` and `FRIZQT___CYR`) share one folder, so
+    # that the copies are still deduplicated as the solid archive did
+    contents = {}
+    for name, path in files:
+        digest = HashFile(path)
+        contents.setdefault(digest, []).append((name, path))
+
+    todo = []
+    for digest, members in contents.items():
+        blob = BlobPath(digest, len(members))
+        if not os.path.exists(blob):
+            todo.append((blob, (members[0][1], len(members), memoryLimit)))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(todo)))) as pool:
+            for (blob, _), (prop, packed) in zip(todo, pool.map(Compress, [job for _, job in todo])):
+                SaveBlob(blob, prop, packed)
+
+    folders = []
+    for digest, members in contents.items():
+        prop, packed = LoadBlob(BlobPath(digest, len(members)))
+        with open(members[0][1], 'rb') as f:
+            data = f.read()
+        crc = zlib.crc32(data)
+        folders.append((prop, packed, [
+            (name, path, len(data), crc, MemberTime(path)) for name, path in members
+        ]))
+
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    WriteArchive(out, directories, folders)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Pack a directory into a 7z archive, compressing each unique font once.")
+    parser.add_argument("out", help="archive to write")
+    parser.add_argument("root", help="directory to pack, stored by its base name")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of compressor processes")
+    parser.add_argument("-m", "--memory-limit", type=int, default=1024,
+                        help="memory limit per compressor process, in MiB")
+    args = parser.parse_args()
+
+    Pack(args.out, args.root, args.jobs, args.memory_limit << 20)
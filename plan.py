@@ -0,0 +1,162 @@
+import os
+import sys
+from configure import phonyKinds
+import history
+
+# Dry-run planner for `python configure.py --plan <target>...`.
+#
+# Lists the jobs make would run for the targets, grouped by kind, with the
+# jobs already up to date, the estimated CPU time and peak memory, and the
+# critical path: the chain of jobs that bounds the wall time however many
+# jobs run in parallel.
+#
+# Costs come from the models fitted on the build history (`history.py`) for
+# the kinds it has recorded, and from the cost hints of the graph otherwise.
+
+# kinds that load whole otfcc JSON documents; their memory grows with the size
+# of the inputs rather than staying near the cost hint
+jsonKinds = ("store", "delta", "merge", "encode")
+jsonMemoryFactor = 8
+
+
+def Expand(graph, path):
+    return path.replace("${VERSION}", str(graph.variable["VERSION"]))
+
+
+def Mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def Size(path):
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def Estimate(graph, node, models, lastInputBytes):
+    # (CPU seconds, peak RSS in MiB) of one job
+    if node.kind in models:
+        cpuModel, rssModel = models[node.kind]
+        paths = [Expand(graph, path) for path in node.inputs]
+        if all(os.path.isfile(path) for path in paths):
+            inputBytes = sum(Size(path) for path in paths)
+        else:
+            # inputs not built yet
+            inputBytes = lastInputBytes.get(node.target)
+        return cpuModel.Predict(inputBytes), rssModel.Predict(inputBytes) / (1 << 20)
+
+    cpu, rss = node.cost
+    if node.kind in jsonKinds:
+        inputBytes = sum(Size(Expand(graph, path)) for path in node.inputs)
+        rss = max(rss, jsonMemoryFactor * inputBytes / (1 << 20))
+    return cpu, rss
+
+
+def StaleJobs(graph, jobs):
+    # targets make would rebuild; a missing intermediate or secondary file is
+    # rebuilt only when one of its consumers is
+    intermediate = set(graph.intermediate) | set(graph.secondary)
+    stale = set()
+    skipped = set()
+    for node in jobs:
+        if node.kind in phonyKinds:
+            if node.kind == "task":
+                stale.add(node.target)
+            continue
+        outputTimes = [Mtime(Expand(graph, path)) for path in node.outputs]
+        if None in outputTimes:
+            if node.target in intermediate:
+                skipped.add(node.target)
+            else:
+                stale.add(node.target)
+            continue
+        for path in node.inputs:
+            inputTime = Mtime(Expand(graph, path))
+            if path in stale or inputTime is not None and inputTime > min(outputTimes):
+                stale.add(node.target)
+                break
+
+    for node in reversed(jobs):
+        if node.target in stale:
+            for path in node.inputs:
+                if path in skipped:
+                    skipped.discard(path)
+                    stale.add(path)
+    return stale
+
+
+def CriticalPath(graph, jobs, stale, estimates):
+    # longest chain of stale jobs by CPU time
+    length = {}
+    previous = {}
+    for node in jobs:
+        if node.target not in stale:
+            continue
+        best = None
+        for path in node.inputs:
+            if path in length and (best is None or length[path] > length[best]):
+                best = path
+        length[node.target] = estimates[node.target][0] + (length[best] if best else 0)
+        previous[node.target] = best
+    if not length:
+        return 0, []
+    target = max(length, key=length.get)
+    path = []
+    while target:
+        path.append(target)
+        target = previous[target]
+    return length[path[0]], path[::-1]
+
+
+def Report(graph, targets, memory=None):
+    unknown = [t for t in targets if t not in graph.nodes]
+    if unknown:
+        print("unknown target {}".format(", ".join(unknown)), file=sys.stderr)
+        return 1
+
+    jobs = graph.Closure(targets)
+    stale = StaleJobs(graph, jobs)
+    models = history.Models()
+    lastInputBytes = history.LastInputBytes()
+    estimates = {node.target: Estimate(graph, node, models, lastInputBytes) for node in jobs}
+
+    summary = {}
+    for node in jobs:
+        if node.kind == "phony":
+            continue
+        kind = summary.setdefault(node.kind, {"jobs": 0, "upToDate": 0, "cpu": 0, "rss": 0})
+        kind["jobs"] += 1
+        if node.target in stale:
+            cpu, rss = estimates[node.target]
+            kind["cpu"] += cpu
+            kind["rss"] = max(kind["rss"], rss)
+        else:
+            kind["upToDate"] += 1
+
+    print("{:<10}{:>8}{:>12}{:>8}{:>12}{:>16}".format(
+        "kind", "jobs", "up to date", "to run", "CPU (s)", "peak RSS (MiB)"))
+    for name, kind in summary.items():
+        print("{:<10}{:>8}{:>12}{:>8}{:>12.0f}{:>16.0f}".format(
+            name, kind["jobs"], kind["upToDate"], kind["jobs"] - kind["upToDate"], kind["cpu"], kind["rss"]))
+    totalCpu = sum(kind["cpu"] for kind in summary.values())
+    peakRss = max((kind["rss"] for kind in summary.values()), default=0)
+    print("{:<10}{:>8}{:>12}{:>8}{:>12.0f}{:>16.0f}".format(
+        "total", sum(kind["jobs"] for kind in summary.values()),
+        sum(kind["upToDate"] for kind in summary.values()),
+        sum(kind["jobs"] - kind["upToDate"] for kind in summary.values()), totalCpu, peakRss))
+
+    length, path = CriticalPath(graph, jobs, stale, estimates)
+    print()
+    print("critical path: {:.0f} s".format(length))
+    for target in path:
+        print("    {} ({}, {:.0f} s)".format(Expand(graph, target), graph.nodes[target].kind, estimates[target][0]))
+    if length:
+        print("at most {:.1f} jobs can run in parallel on average".format(totalCpu / length))
+    if memory and peakRss:
+        print("-j{} fits in {:g} GiB with the heaviest jobs running together".format(
+            max(1, int(memory * 1024 // peakRss)), memory))
+    return 0
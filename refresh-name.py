@@ -0,0 +1,42 @@
+import os
+import sys
+import configure
+import otdio
+import journal
+from merge import NameFont, ReadNameStamp, WriteNameStamp
+
+# Re-apply `NameFont` to merged fonts whose naming fields in `configure.Config`
+# (version, copyright, descriptions, designers, ...) have changed, instead of
+# merging them again. Encoded and compiled fonts are regenerated by make
+# afterwards, as they are now older than the refreshed documents.
+
+if __name__ == '__main__':
+    current = configure.NameConfigStamp()
+    refreshed = 0
+
+    if os.path.isdir("build/nowar"):
+        filenames = sorted(os.listdir("build/nowar"))
+    else:
+        filenames = []
+
+    for filename in filenames:
+        if not (filename.startswith("unspec-") and filename.endswith(".otd")):
+            continue
+        path = os.path.join("build/nowar", filename)
+        stamp = ReadNameStamp(filename[:-len(".otd")])
+        if stamp is None:
+            print("{}: no name stamp, skipped; merge it again once to enable refreshing".format(
+                path), file=sys.stderr)
+            continue
+        if stamp["name"] == current:
+            continue
+
+        param = stamp["param"]
+        font = otdio.LoadOtd(path)
+        NameFont(param, font)
+        otdio.WriteOtd(path, font)
+        WriteNameStamp(param)
+        journal.Record([path])
+        refreshed += 1
+
+    print("{} fonts renamed".format(refreshed))
@@ -0,0 +1,65 @@
+import os
+import json
+import shutil
+import argparse
+import configure
+import pack
+
+
+def LinkOrCopy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def Release(out, includeAll, jobs, memoryLimit):
+    name = os.path.splitext(os.path.basename(out))[0]
+    root = os.path.join("build/release", name)
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(os.path.join(root, "blobs"))
+
+    manifest = {
+        "version": configure.config.version,
+        "packs": {},
+    }
+    digests = {}
+    slotCount = 0
+    for f, r, w, fea in configure.GetFontPacks():
+        if not includeAll and not configure.IsExportedPack(r, fea):
+            continue
+        slots = {}
+        for slot, p in configure.GetFontList(f, w, r, fea).items():
+            font = "build/nowar/{}.otf".format(configure.GenerateFilename(p))
+            if font not in digests:
+                digests[font] = pack.HashFile(font)
+                blob = os.path.join(root, "blobs", digests[font] + ".ttf")
+                if not os.path.exists(blob):
+                    LinkOrCopy(font, blob)
+            slots[slot] = digests[font]
+        slotCount += len(slots)
+        manifest["packs"][configure.GetPackName(f, r, w, fea)] = slots
+
+    with open(os.path.join(root, "manifest.json"), 'w', encoding='UTF-8') as mf:
+        json.dump(manifest, mf, ensure_ascii=False, indent=1)
+    shutil.copyfile("LICENSE.txt", os.path.join(root, "LICENSE.txt"))
+    shutil.copyfile("install.py", os.path.join(root, "install.py"))
+
+    print("{}: {} packs, {} font slots, {} unique fonts".format(
+        out, len(manifest["packs"]), slotCount, len(set(digests.values()))))
+    pack.Pack(out, root, jobs, memoryLimit)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Pack the release as one archive of unique fonts plus a per-pack manifest.")
+    parser.add_argument("out", help="archive to write")
+    parser.add_argument("--all", action="store_true",
+                        help="include every feature variant, not only the exported ones")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                        help="number of compressor processes")
+    parser.add_argument("-m", "--memory-limit", type=int, default=1024,
+                        help="memory limit per compressor process, in MiB")
+    args = parser.parse_args()
+
+    Release(args.out, args.all, args.jobs, args.memory_limit << 20)
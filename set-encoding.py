@@ -1,7 +1,97 @@
 import sys
 import json
-import codecs
+from libotd.gc import Gc, Consolidate
 import configure
+import otdio
+from glyphorder import OrderGlyphs
+
+# coverage profiles for `Config.subsetByEncoding`: the legacy codecs of the
+# client locale plus extra ranges. Latin, Greek, Cyrillic and symbols are
+# always kept.
+# up to CJK Radicals Supplement, without Hangul Jamo
+lcgRanges = [(0x0000, 0x10FF), (0x1200, 0x2E7F), (0xA640, 0xA7FF), (0xFB00, 0xFB06), (0xFFF9, 0xFFFD)]
+cjkRanges = [(0x3000, 0x303F), (0xFF00, 0xFFEF)]
+hangulRanges = [(0x1100, 0x11FF), (0x3130, 0x318F), (0xAC00, 0xD7A3)]
+
+coverageProfile = {
+    "abg": ([], []),
+    "gbk": (["gbk"], cjkRanges),
+    "big5": (["cp950"], cjkRanges),
+    "jis": (["cp932"], cjkRanges),
+    "korean": (["euc_kr"], cjkRanges + hangulRanges),
+}
+
+# CJK code pages of `OS_2.ulCodePageRange1`; the encoding step claims some of
+# them, on purpose even where subsetting removes their characters, and
+# subsetting clears the others
+cjkCodePages = ["gbk", "big5", "jis", "korean", "koreanJohab"]
+
+
+def ClaimedCodePages(encoding):
+    if encoding == "abg":
+        return ["gbk", "big5", "jis", "korean"]
+    return [encoding]
+
+# bits of `OS_2.ulUnicodeRange1` to `ulUnicodeRange4` subsetting can leave
+# without characters, by range
+unicodeRangeBlocks = {
+    "hangulJamo": [(0x1100, 0x11FF)],
+    "cjkSymbolsAndPunctuation": [(0x3000, 0x303F)],
+    "hiragana": [(0x3040, 0x309F)],
+    "katakana": [(0x30A0, 0x30FF), (0x31F0, 0x31FF)],
+    "bopomofo": [(0x3100, 0x312F), (0x31A0, 0x31BF)],
+    "hangulCompatibilityJamo": [(0x3130, 0x318F)],
+    "enclosedCJKLettersAndMonths": [(0x3200, 0x32FF)],
+    "cjkCompatibility": [(0x3300, 0x33FF)],
+    "hangulSyllables": [(0xAC00, 0xD7AF)],
+    "cjkUnifiedIdeographs": [(0x2E80, 0x2FDF), (0x2FF0, 0x2FFF), (0x3190, 0x319F), (0x3400, 0x4DBF),
+                             (0x4E00, 0x9FFF), (0x20000, 0x2A6DF)],
+    "cjkStrokes": [(0x31C0, 0x31EF)],
+    "cjkCompatibilityIdeographs": [(0xF900, 0xFAFF), (0x2F800, 0x2FA1F)],
+    "cjkCompatibilityForms": [(0xFE30, 0xFE4F)],
+    "halfwidthAndFullwidthForms": [(0xFF00, 0xFFEF)],
+}
+
+
+def IsCovered(u, codecNames, ranges):
+    if any(lo <= u <= hi for lo, hi in lcgRanges + ranges):
+        return True
+    for codec in codecNames:
+        try:
+            chr(u).encode(codec)
+            return True
+        except UnicodeEncodeError:
+            pass
+    return False
+
+
+def Subset(font, encoding):
+    codecNames, ranges = coverageProfile[encoding]
+    cmap = font['cmap']
+    for u in [u for u in cmap if not IsCovered(int(u), codecNames, ranges)]:
+        del cmap[u]
+    # variation sequences are keyed "<code point> <selector>"
+    uvs = font.get('cmap_uvs', {})
+    for key in [key for key in uvs if key.split()[0] not in cmap]:
+        del uvs[key]
+
+    # OS/2 must not claim the blocks that were removed, nor code pages other
+    # than those of the encoding
+    os2 = font['OS_2']
+    codePages = os2.get('ulCodePageRange1', {})
+    claimed = ClaimedCodePages(encoding)
+    for codePage in cjkCodePages:
+        if codePage in codePages and codePage not in claimed:
+            codePages[codePage] = False
+    codes = [int(u) for u in cmap]
+    for field in ['ulUnicodeRange1', 'ulUnicodeRange2', 'ulUnicodeRange3', 'ulUnicodeRange4']:
+        bits = os2.get(field, {})
+        for block in bits.keys() & unicodeRangeBlocks.keys():
+            if not any(lo <= u <= hi for u in codes for lo, hi in unicodeRangeBlocks[block]):
+                bits[block] = False
+    Gc(font)
+    Consolidate(font)
+
 
 if __name__ == '__main__':
     param = sys.argv[1]
@@ -9,18 +99,13 @@ if __name__ == '__main__':
 
     dep = {**param, "encoding": "unspec"}
 
-    with open("build/nowar/{}.otd".format(configure.GenerateFilename(dep)), 'rb') as baseFile:
-        baseFont = json.loads(
-            baseFile.read().decode('UTF-8', errors='replace'))
-
-    if param["encoding"] == "abg":
-        baseFont['OS_2']['ulCodePageRange1']["gbk"] = True
-        baseFont['OS_2']['ulCodePageRange1']["big5"] = True
-        baseFont['OS_2']['ulCodePageRange1']["jis"] = True
-        baseFont['OS_2']['ulCodePageRange1']["korean"] = True
-    else:
-        baseFont['OS_2']['ulCodePageRange1'][param["encoding"]] = True
-
-    outStr = json.dumps(baseFont, ensure_ascii=False, separators=(',', ':'))
-    with codecs.open("build/nowar/{}.otd".format(configure.GenerateFilename(param)), 'w', 'UTF-8') as outFile:
-        outFile.write(outStr)
+    baseFont = otdio.LoadOtd("build/nowar/{}.otd".format(configure.GenerateFilename(dep)))
+
+    for codePage in ClaimedCodePages(param["encoding"]):
+        baseFont['OS_2']['ulCodePageRange1'][codePage] = True
+
+    if configure.config.subsetByEncoding:
+        Subset(baseFont, param["encoding"])
+    OrderGlyphs(baseFont, param["encoding"])
+
+    otdio.WriteOtd("build/nowar/{}.otd".format(configure.GenerateFilename(param)), baseFont)
@@ -0,0 +1,21 @@
+import glyphstore
+
+
+def Glyph():
+    return {"advanceWidth": 1000, "contours": [[{"x": 0, "y": 0, "on": True}]]}
+
+
+def test_reconstruct_copies_glyphs_sharing_an_outline():
+    glyphs = {}
+    ref = glyphstore.Ingest(glyphs, {
+        "cmap": {"32": "space", "12288": "ideographicspace"},
+        "glyf": {"space": Glyph(), "ideographicspace": {**Glyph(), "CFF_fdSelect": "Dingbats"}},
+    })
+    assert len(glyphs) == 1
+
+    font = glyphstore.Reconstruct(glyphs, ref)
+    font["glyf"]["space"]["advanceWidth"] *= 2
+    font["glyf"]["space"]["contours"][0][0]["x"] = 10
+
+    assert font["glyf"]["ideographicspace"] == {**Glyph(), "CFF_fdSelect": "Dingbats"}
+    assert glyphstore.Reconstruct(glyphs, ref)["glyf"]["space"] == Glyph()
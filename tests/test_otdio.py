@@ -0,0 +1,17 @@
+import math
+import pytest
+import otdio
+
+
+edgeCases = [
+    1e-5, 2.5e-5, 1e-4, 0.1, -0.0, 1e16, 1.2345e17, 9999999999999998.0, 5e-324, 1.7976931348623157e308,
+    math.nan, math.inf, -math.inf, None,
+]
+
+
+@pytest.mark.parametrize("backend", list(otdio.backends))
+@pytest.mark.parametrize("value", edgeCases, ids=repr)
+def test_dumps_writes_floats_as_the_standard_library(backend, value):
+    _, dumps = otdio.backends[backend]
+    font = {"glyf": {"uni4E00": {"advanceWidth": 1000, "x": value}}, "name": ["0.00001", "1e16", "null"]}
+    assert dumps(font) == otdio.JsonDumps(font)
@@ -0,0 +1,39 @@
+import math
+import outline
+
+
+def Point(x, y, on=True):
+    return {"x": x, "y": y, "on": on}
+
+
+def Deviation(contour, simplified):
+    # the largest distance of a point of `contour` from the outline of `simplified`
+    segments = list(zip(simplified, simplified[1:] + simplified[:1]))
+    return max(min(outline.SegmentDistance(p, a, b) for a, b in segments) for p in contour)
+
+
+def test_simplified_arc_stays_within_tolerance():
+    # a quarter circle drawn as a polyline of rounded points, closed through
+    # the centre; each point is almost on the line between its neighbours
+    contour = [Point(0, 0)] + [
+        Point(round(1000 * math.cos(math.radians(a / 4))), round(1000 * math.sin(math.radians(a / 4))))
+        for a in range(0, 361)
+    ]
+    simplified = outline.SimplifyContour(contour, 1)
+    assert len(simplified) < len(contour)
+    assert Deviation(contour, simplified) <= 1
+
+
+def test_redundant_start_point_is_removed():
+    # the first point lies on the edge between the last and the second
+    contour = [Point(50, 0), Point(100, 0), Point(100, 100), Point(0, 100), Point(0, 0)]
+    assert outline.SimplifyContour(contour, 1) == contour[1:]
+
+
+def test_curve_ends_are_kept():
+    # of two points within the tolerance, the one starting the curve stays
+    contour = [
+        Point(0, 0), Point(1, 0), Point(50, 50, False), Point(100, 50, False), Point(100, 0),
+        Point(100, -100), Point(2, -100),
+    ]
+    assert outline.SimplifyContour(contour, 1) == contour[1:]
@@ -0,0 +1,53 @@
+import importlib.util
+import os
+import pytest
+
+pytest.importorskip("libotd.gc")
+
+
+def LoadSetEncoding():
+    # the script's name is not a module name
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "set-encoding.py")
+    spec = importlib.util.spec_from_file_location("set_encoding", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def Font():
+    codes = {"A": 0x41, "uni1100": 0x1100, "uni4E00": 0x4E00, "uniAC00": 0xAC00}
+    return {
+        "cmap": {str(u): name for name, u in codes.items()},
+        "cmap_uvs": {"19968 917760": "uni4E00", "65 65024": "A"},
+        "glyf": {name: {"advanceWidth": 1000} for name in codes},
+        "glyph_order": list(codes),
+        "OS_2": {
+            "ulCodePageRange1": {"latin1": True, "gbk": True, "big5": True, "jis": True, "korean": True,
+                                 "koreanJohab": True},
+            "ulUnicodeRange1": {"basicLatin": True, "hangulJamo": True},
+            "ulUnicodeRange2": {"cjkUnifiedIdeographs": True, "hangulSyllables": True},
+        },
+    }
+
+
+def test_abg_keeps_its_code_pages():
+    setEncoding = LoadSetEncoding()
+    font = Font()
+    setEncoding.Subset(font, "abg")
+
+    assert font["cmap"] == {"65": "A"}
+    assert font["cmap_uvs"] == {"65 65024": "A"}
+    assert font["OS_2"]["ulCodePageRange1"] == {
+        "latin1": True, "gbk": True, "big5": True, "jis": True, "korean": True, "koreanJohab": False}
+    assert font["OS_2"]["ulUnicodeRange1"] == {"basicLatin": True, "hangulJamo": False}
+    assert font["OS_2"]["ulUnicodeRange2"] == {"cjkUnifiedIdeographs": False, "hangulSyllables": False}
+
+
+def test_gbk_clears_other_code_pages():
+    setEncoding = LoadSetEncoding()
+    font = Font()
+    setEncoding.Subset(font, "gbk")
+
+    assert "19968" in font["cmap"] and "44032" not in font["cmap"]
+    assert font["OS_2"]["ulCodePageRange1"] == {
+        "latin1": True, "gbk": True, "big5": False, "jis": False, "korean": False, "koreanJohab": False}